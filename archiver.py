@@ -0,0 +1,149 @@
+"""Moves past shifts from shifts to shifts_archive.
+
+The bot does this in the background; to archive a backlog at once:
+
+    python archiver.py              # shifts older than ARCHIVE_AFTER_DAYS
+    python archiver.py --days 30
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import insert, select
+from telegram.ext import Application
+
+from handlers.shifts import invalidate_all_schedules
+from logging_setup import configure_logging
+from models import (
+    ArchivedShift, NewShift, Notification, Shift, ShiftReminder,
+    call_in_session, run_in_session,
+)
+from settings import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = ('id', 'point_id', 'date', 'worker_id')
+
+
+def archive_batch(session, before, limit):
+    """Moves up to limit of the oldest shifts dated before `before`.
+
+    Runs in one transaction and returns the number of shifts moved.
+    """
+    shift_ids = [
+        shift_id for shift_id, in session.query(Shift.id)
+        .filter(Shift.date < before)
+        .order_by(Shift.date, Shift.id)
+        .limit(limit)
+    ]
+    if not shift_ids:
+        return 0
+    session.execute(insert(ArchivedShift).from_select(
+        ARCHIVE_COLUMNS,
+        select(*(getattr(Shift, name) for name in ARCHIVE_COLUMNS))
+        .where(Shift.id.in_(shift_ids)),
+    ))
+    for model in (Notification, NewShift, ShiftReminder):
+        session.query(model).filter(
+            model.shift_id.in_(shift_ids),
+        ).delete(synchronize_session=False)
+    session.query(Shift).filter(
+        Shift.id.in_(shift_ids),
+    ).delete(synchronize_session=False)
+    session.commit()
+    return len(shift_ids)
+
+
+class ShiftArchiver:
+    """Keeps the shifts table to the recent past and the future.
+
+    Every interval seconds shifts dated more than after_days ago move
+    to shifts_archive, batch_size at a time, each batch in its own
+    short transaction with a pause in between, so other writers never
+    wait behind the whole backlog. Shift handlers and their indexes
+    only see the hot table; export and the statistics rebuild read
+    both.
+    """
+
+    def __init__(self, after_days: int = 180, interval: float = 3600,
+                 batch_size: int = 1000, pause: float = 0.05) -> None:
+        self.after = datetime.timedelta(days=after_days)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self._task: Optional[asyncio.Task] = None
+        self.archived = 0
+        self.batches = 0
+        self.last_batch = 0.0
+
+    def stats(self) -> dict:
+        return {
+            'archived_total': self.archived,
+            'batches_total': self.batches,
+            'last_batch_seconds': round(self.last_batch, 6),
+        }
+
+    async def run_once(self) -> int:
+        before = datetime.date.today() - self.after
+        moved_total = 0
+        while True:
+            start = time.perf_counter()
+            moved = await run_in_session(archive_batch, before,
+                                         self.batch_size)
+            if not moved:
+                break
+            self.last_batch = time.perf_counter() - start
+            self.batches += 1
+            self.archived += moved
+            moved_total += moved
+            await asyncio.sleep(self.pause)
+        if moved_total:
+            invalidate_all_schedules()
+            logger.info('Archived %d shifts dated before %s',
+                        moved_total, before)
+        return moved_total
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception('Archiving failed')
+            await asyncio.sleep(self.interval)
+
+    async def start(self, application: Application) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self, application: Optional[Application] = None) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help='archive shifts older than this many days')
+    args = parser.parse_args()
+
+    configure_logging()
+    before = datetime.date.today() - datetime.timedelta(days=args.days)
+    moved_total = 0
+    while True:
+        moved = call_in_session(archive_batch, before, ARCHIVE_BATCH_SIZE)
+        if not moved:
+            break
+        moved_total += moved
+    logger.info('Archived %d shifts dated before %s', moved_total, before)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""Shift archival on a throwaway database: lock hold times and effect.
+
+Seeds points and --shifts shifts spread over --years of history plus
+two months ahead, times the hot queries (schedule page, open shifts,
+insert) and then archives everything older than --after-days in
+batches while another thread keeps inserting shifts one at a time.
+Prints batch durations, the latency the concurrent writer saw, and the
+hot queries again on the smaller table, and checks that deleting the
+newest shift does not let the next insert reuse its id.
+
+    python -m benchmarks.archive --shifts 1000000 --batch-size 1000
+    python -m benchmarks.archive --database-url postgresql://...
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(session, args, rng):
+    from sqlalchemy import insert
+
+    from models import Point, Shift, User
+
+    session.execute(insert(User), [{'telegram_id': 1, 'role': 'reg_owner'},
+                                   {'telegram_id': 2, 'role': 'reg_worker'}])
+    session.execute(insert(Point), [
+        {'name': f'ПВЗ {index}', 'address': 'ул. Тестовая', 'owner_id': 1}
+        for index in range(args.points)
+    ])
+    today = datetime.date.today()
+    days = args.years * 365
+    # A point has at most one shift a day: draw distinct slots.
+    slots = rng.sample(range(args.points * (days + 61)), args.shifts)
+    for start in range(0, args.shifts, 10000):
+        session.execute(insert(Shift), [
+            {'point_id': slot % args.points + 1,
+             'date': today + datetime.timedelta(
+                 days=slot // args.points - days),
+             'worker_id': 2 if rng.random() < 0.9 else None}
+            for slot in slots[start:start + 10000]
+        ])
+    session.commit()
+
+
+def time_hot_queries(args, rng, rounds=200):
+    from handlers.shifts import fetch_open_shifts, fetch_shifts_page
+    from models import call_in_session
+
+    today = datetime.date.today()
+    timings = {}
+    for label, func in (
+        ('schedule page', lambda point_id: call_in_session(
+            fetch_shifts_page, point_id, None, None)),
+        ('open shifts', lambda point_id: call_in_session(
+            fetch_open_shifts, point_id, (today, 0))),
+    ):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func(rng.randint(1, args.points))
+        timings[label] = (time.perf_counter() - start) / rounds * 1000
+    return timings
+
+
+def count_rows(session):
+    from models import ArchivedShift, Shift
+
+    return (session.query(Shift).count(),
+            session.query(ArchivedShift).count())
+
+
+def insert_one(session, point_id, date):
+    from handlers.shifts import insert_shift
+
+    return insert_shift(session, point_id, date)
+
+
+def replace_newest(session):
+    """Deletes the newest shift and adds it again; returns both ids."""
+    from sqlalchemy import func
+
+    from handlers.shifts import insert_shift, remove_shift
+    from models import Shift
+
+    newest = session.query(func.max(Shift.id)).scalar()
+    point_id, date = remove_shift(session, newest)
+    return newest, insert_shift(session, point_id, date)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shifts', type=int, default=1000000)
+    parser.add_argument('--points', type=int, default=2000)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--after-days', type=int, default=180)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--database-url',
+                        help='database to use, a temporary SQLite by default')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    workdir = tempfile.mkdtemp(prefix='archive-bench-')
+    os.environ['DATABASE_URL'] = (
+        args.database_url or f'sqlite:///{workdir}/bench.db')
+
+    from archiver import archive_batch
+    from migrations import migrate
+    from models import call_in_session
+
+    migrate()
+    rng = random.Random(args.seed)
+    call_in_session(seed, args, rng)
+    print('hot, archived rows before: %d, %d' % call_in_session(count_rows))
+    before = time_hot_queries(args, rng)
+
+    stop = threading.Event()
+    write_latency = []
+
+    def write():
+        today = datetime.date.today()
+        while not stop.is_set():
+            start = time.perf_counter()
+            call_in_session(insert_one, rng.randint(1, args.points),
+                            today + datetime.timedelta(days=7))
+            write_latency.append(time.perf_counter() - start)
+            time.sleep(0.005)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    cutoff = datetime.date.today() - datetime.timedelta(days=args.after_days)
+    batches = []
+    start = time.perf_counter()
+    while True:
+        batch_start = time.perf_counter()
+        if not call_in_session(archive_batch, cutoff, args.batch_size):
+            break
+        batches.append(time.perf_counter() - batch_start)
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    writer.join()
+
+    print('hot, archived rows after: %d, %d' % call_in_session(count_rows))
+    print(f'{len(batches)} batches of {args.batch_size} in {elapsed:.1f}s:'
+          f' median {statistics.median(batches) * 1000:.1f} ms,'
+          f' max {max(batches) * 1000:.1f} ms')
+    write_latency.sort()
+    print(f'concurrent inserts: {len(write_latency)},'
+          f' p50 {statistics.median(write_latency) * 1000:.1f} ms,'
+          f' p99 {write_latency[int(len(write_latency) * 0.99)] * 1000:.1f}'
+          f' ms, max {write_latency[-1] * 1000:.1f} ms')
+    # An id handed out again would clash with its archived namesake.
+    deleted, added = call_in_session(replace_newest)
+    if added <= deleted:
+        sys.exit(f'shift id {added} reused after deleting {deleted}')
+    print(f'newest shift {deleted} deleted, the next insert got {added}')
+    after = time_hot_queries(args, rng)
+    for label in before:
+        print(f'{label}: {before[label]:.2f} ms before,'
+              f' {after[label]:.2f} ms after')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Concurrent shift claiming stress test on a throwaway database.
+
+Seeds points, a history of taken shifts and a set of open shifts, then
+for each open shift releases --claimers threads at once, all calling
+claim_shift on it. Checks that every shift got exactly one winner and
+that the database agrees, and times the open-shift listing query that
+the partial indexes serve.
+
+    python -m benchmarks.claim_stress --shifts 200 --claimers 32
+    python -m benchmarks.claim_stress --database-url postgresql://...
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(session, args, rng):
+    from sqlalchemy import insert
+
+    from models import Point, Shift, User
+
+    session.execute(insert(User), [{'telegram_id': 1, 'role': 'reg_owner'}]
+                    + [{'telegram_id': 1000 + index, 'role': 'reg_worker'}
+                       for index in range(args.claimers)])
+    session.execute(insert(Point), [
+        {'name': f'ПВЗ {index}', 'address': 'ул. Тестовая', 'owner_id': 1}
+        for index in range(args.points)
+    ])
+    today = datetime.date.today()
+    # A point has at most one shift a day: draw distinct slots.
+    history = [
+        {'point_id': slot % args.points + 1,
+         'date': today - datetime.timedelta(days=slot // args.points + 1),
+         'worker_id': rng.randint(2, args.claimers + 1)}
+        for slot in rng.sample(range(args.points * 1000), args.history)
+    ]
+    for start in range(0, len(history), 10000):
+        session.execute(insert(Shift), history[start:start + 10000])
+    result = session.execute(insert(Shift).returning(Shift.id), [
+        {'point_id': slot % args.points + 1,
+         'date': today + datetime.timedelta(days=slot // args.points)}
+        for slot in rng.sample(range(args.points * 61), args.shifts)
+    ])
+    shift_ids = [shift_id for shift_id, in result]
+    session.commit()
+    return shift_ids
+
+
+def contest(shift_id, worker_ids):
+    from handlers.shifts import claim_shift
+    from models import call_in_session
+
+    barrier = threading.Barrier(len(worker_ids))
+    results = []
+
+    def claim(worker_id):
+        barrier.wait()
+        try:
+            results.append((worker_id, call_in_session(
+                claim_shift, shift_id, worker_id)))
+        except Exception as error:
+            results.append((worker_id, type(error).__name__))
+
+    threads = [threading.Thread(target=claim, args=(worker_id,))
+               for worker_id in worker_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shifts', type=int, default=200,
+                        help='open shifts to fight over')
+    parser.add_argument('--claimers', type=int, default=32,
+                        help='workers claiming each shift at once')
+    parser.add_argument('--points', type=int, default=1000)
+    parser.add_argument('--history', type=int, default=200000,
+                        help='taken past shifts in the table')
+    parser.add_argument('--database-url',
+                        help='database to use, a temporary SQLite by default')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    workdir = tempfile.mkdtemp(prefix='claim-bench-')
+    os.environ['DATABASE_URL'] = (
+        args.database_url or f'sqlite:///{workdir}/bench.db')
+    os.environ.setdefault('DB_POOL_SIZE', str(args.claimers))
+
+    from handlers.shifts import fetch_open_shifts
+    from migrations import migrate
+    from models import Shift, call_in_session
+
+    migrate()
+    rng = random.Random(args.seed)
+    shift_ids = call_in_session(seed, args, rng)
+    worker_ids = list(range(2, args.claimers + 2))
+
+    outcomes = Counter()
+    winners = {}
+    start = time.perf_counter()
+    for shift_id in shift_ids:
+        results = contest(shift_id, worker_ids)
+        outcomes.update(result for _, result in results)
+        claimed = [worker_id for worker_id, result in results
+                   if result == 'claimed']
+        if len(claimed) != 1:
+            sys.exit(f'shift {shift_id}: {len(claimed)} winners')
+        winners[shift_id] = claimed[0]
+    elapsed = time.perf_counter() - start
+
+    stored = dict(call_in_session(
+        lambda session: session.query(Shift.id, Shift.worker_id)
+        .filter(Shift.id.in_(shift_ids)).all()))
+    if stored != winners:
+        sys.exit('database disagrees with the reported winners')
+    attempts = len(shift_ids) * len(worker_ids)
+    print(f'{attempts} claims on {len(shift_ids)} shifts in {elapsed:.2f}s'
+          f' ({attempts / elapsed:.0f} claims/s), one winner each')
+    print('outcomes: ' + ', '.join(
+        f'{name}={count}' for name, count in sorted(outcomes.items())))
+
+    today = datetime.date.today()
+    point_ids = [rng.randint(1, args.points) for _ in range(1000)]
+    start = time.perf_counter()
+    for point_id in point_ids:
+        call_in_session(fetch_open_shifts, point_id, (today, 0))
+    per_query = (time.perf_counter() - start) / len(point_ids)
+    print(f'open shifts at a point: {per_query * 1000:.2f} ms per page'
+          f' with {args.history} taken shifts in history')
+
+
+if __name__ == '__main__':
+    main()
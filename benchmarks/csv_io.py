@@ -0,0 +1,96 @@
+"""CSV import/export benchmark on a throwaway SQLite database.
+
+Imports a generated file of points and then of shifts through the same
+functions the document handlers use, exports both back, and reports
+rows/s and peak Python memory for each step.
+
+    python -m benchmarks.csv_io --rows 100000
+"""
+import argparse
+import csv
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_points_csv(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['name', 'address'])
+        for index in range(rows):
+            writer.writerow([f'ПВЗ {index}', f'ул. Тестовая, {index}'])
+
+
+def write_shifts_csv(path, rows, points, seed=0):
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['point_id', 'date'])
+        for _ in range(rows):
+            date = today + datetime.timedelta(days=rng.randint(0, 365))
+            writer.writerow([rng.randint(1, points), date.isoformat()])
+
+
+def measure(label, rows, func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<16}{rows:>10} rows{elapsed:>9.2f}s'
+          f'{rows / elapsed:>12.0f} rows/s{peak / 2 ** 20:>9.1f} MiB peak')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--database-url',
+                        help='database to use, a temporary SQLite by default')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    workdir = tempfile.mkdtemp(prefix='csv-bench-')
+    os.environ['DATABASE_URL'] = (
+        args.database_url or f'sqlite:///{workdir}/bench.db')
+
+    from handlers.documents import export_points, export_shifts, import_csv
+    from migrations import migrate
+    from models import User, call_in_session
+
+    migrate()
+
+    def create_owner(session):
+        user = User(telegram_id=1, role='reg_owner')
+        session.add(user)
+        session.commit()
+        return user.id
+
+    owner_id = call_in_session(create_owner)
+    points_path = os.path.join(workdir, 'points.csv')
+    shifts_path = os.path.join(workdir, 'shifts.csv')
+    write_points_csv(points_path, args.rows)
+    write_shifts_csv(shifts_path, args.rows, args.rows)
+
+    measure('import points', args.rows, call_in_session,
+            import_csv, owner_id, points_path)
+    _, inserted, _ = measure('import shifts', args.rows, call_in_session,
+                             import_csv, owner_id, shifts_path)
+    with tempfile.TemporaryFile() as file:
+        measure('export points', args.rows, call_in_session,
+                export_points, owner_id, file)
+    with tempfile.TemporaryFile() as file:
+        measure('export shifts', inserted, call_in_session,
+                export_shifts, owner_id, file)
+
+
+if __name__ == '__main__':
+    main()
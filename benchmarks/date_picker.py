@@ -0,0 +1,62 @@
+"""Calendar callback microbenchmark: DetailedTelegramCalendar vs
+ShiftDatePicker on the same stream of taps.
+
+    python -m benchmarks.date_picker --taps 20000
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def generate_taps(count, seed=0):
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    taps = []
+    for _ in range(count):
+        day = today + datetime.timedelta(days=rng.randint(0, 90))
+        taps.append(rng.choice([
+            f'cbcal_0_s_y_{day.year}_{day.month}_{day.day}',
+            f'cbcal_0_s_m_{day.year}_{day.month}_{day.day}',
+            f'cbcal_0_g_d_{day.year}_{day.month}_1',
+            f'cbcal_0_s_d_{day.year}_{day.month}_{day.day}',
+        ]))
+    return taps
+
+
+def measure(label, taps, process):
+    start = time.perf_counter()
+    for data in taps:
+        process(data)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<26}{elapsed * 1e6 / len(taps):>10.1f} us/tap')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--taps', type=int, default=20000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    # Importing handlers opens the database, keep it away from the real one.
+    os.environ['DATABASE_URL'] = (
+        f'sqlite:///{tempfile.mkdtemp(prefix="date-picker-")}/bench.db')
+    from telegram_bot_calendar import DetailedTelegramCalendar
+
+    from handlers.date_picker import ShiftDatePicker
+
+    taps = generate_taps(args.taps)
+    picker = ShiftDatePicker(locale='ru')
+    measure('DetailedTelegramCalendar',
+            taps, lambda data: DetailedTelegramCalendar(
+                locale='ru').process(data))
+    measure('ShiftDatePicker', taps, picker.process)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Concurrent read/write throughput of the supported database setups.
+
+Compares SQLite with driver defaults, SQLite with the tuned settings
+from models.create_db_engine and, if --postgres is given, pooled
+Postgres. Each setup gets a fresh schema seeded with points; worker
+threads then mix point/shift reads with single-shift write transactions.
+
+    python -m benchmarks.db_backends --threads 16 --seconds 5
+    python -m benchmarks.db_backends --postgres postgresql://localhost/bench
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(engine, points):
+    from sqlalchemy import insert
+
+    from models import Base, Point, User
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{'telegram_id': 1,
+                                           'role': 'reg_owner'}])
+        connection.execute(insert(Point), [
+            {'name': f'ПВЗ {index}', 'address': 'ул. Тестовая',
+             'owner_id': 1}
+            for index in range(points)
+        ])
+
+
+def worker(engine, points, write_ratio, deadline, counters, seed_value):
+    from sqlalchemy import func
+    from sqlalchemy.orm import Session
+
+    from handlers.shifts import insert_shift
+    from models import Point, Shift
+
+    rng = random.Random(seed_value)
+    today = datetime.date.today()
+    reads = writes = errors = 0
+    while time.perf_counter() < deadline:
+        point_id = rng.randint(1, points)
+        try:
+            with Session(engine) as session:
+                if rng.random() < write_ratio:
+                    insert_shift(session, point_id, today
+                                 + datetime.timedelta(
+                                     days=rng.randint(0, 365)))
+                    writes += 1
+                else:
+                    session.get(Point, point_id)
+                    session.query(func.count(Shift.id)).filter(
+                        Shift.point_id == point_id).scalar()
+                    reads += 1
+        except Exception:
+            errors += 1
+    counters.append((reads, writes, errors))
+
+
+def run(label, engine, args):
+    seed(engine, args.points)
+    counters = []
+    deadline = time.perf_counter() + args.seconds
+    threads = [
+        threading.Thread(target=worker, args=(
+            engine, args.points, args.write_ratio, deadline, counters, index))
+        for index in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    reads, writes, errors = map(sum, zip(*counters))
+    print(f'{label:<16}{reads / args.seconds:>12.0f} reads/s'
+          f'{writes / args.seconds:>12.0f} writes/s{errors:>8} errors')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--points', type=int, default=10000)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--postgres',
+                        help='URL of an empty Postgres database to use')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='db-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{workdir}/models.db'
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import create_engine
+
+    from models import create_db_engine
+
+    run('sqlite default',
+        create_engine(f'sqlite:///{workdir}/default.db'), args)
+    run('sqlite tuned', create_db_engine(f'sqlite:///{workdir}/tuned.db'),
+        args)
+    if args.postgres:
+        run('postgres pooled', create_db_engine(args.postgres), args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""Duplicate shift creation under replayed callbacks, checked end to end.
+
+Handlers: for --days point days, --owners owners each walk /addshift up
+to the calendar, then the final day tap reaches the bot --repeats
+times per owner at once, half as redeliveries of the same callback
+query and half as fresh taps. The copies bypass per-chat ordering, as
+after a restart or a webhook retry. Database: --threads threads call
+insert_shift for the same point and day at once.
+
+Both parts check that every point day holds one shift, that exactly
+one caller was told it was added and that shift_stats agrees.
+
+    python -m benchmarks.duplicate_shifts --days 200 --owners 4 --repeats 6
+    python -m benchmarks.duplicate_shifts --database-url postgresql://...
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(session, args):
+    from sqlalchemy import insert
+
+    from models import Point, User
+
+    session.execute(insert(User), [
+        {'telegram_id': telegram_id, 'role': 'reg_owner'}
+        for telegram_id in range(1, args.owners + 1)
+    ])
+    session.execute(insert(Point), [
+        {'name': f'ПВЗ {index}', 'address': 'ул. Тестовая', 'owner_id': 1}
+        for index in range(args.points)
+    ])
+    session.commit()
+
+
+def check_database(session, expected):
+    from sqlalchemy import func
+
+    from models import Shift
+    from shift_stats import rebuild_stats
+
+    stored = Counter(dict(
+        ((point_id, date), count) for point_id, date, count in
+        session.query(Shift.point_id, Shift.date, func.count(Shift.id))
+        .group_by(Shift.point_id, Shift.date)
+    ))
+    if set(stored) != expected or any(
+            count != 1 for count in stored.values()):
+        sys.exit(f'{sum(stored.values())} shifts stored for'
+                 f' {len(expected)} point days')
+    if rebuild_stats(session, fix=False):
+        sys.exit('shift_stats disagrees with the shifts')
+
+
+def make_api():
+    from benchmarks.fake_bot_api import FakeBotApi
+
+    class RecordingBotApi(FakeBotApi):
+        def __init__(self) -> None:
+            super().__init__()
+            self.texts = Counter()
+
+        def respond(self, method, params):
+            if method == 'editMessageText':
+                self.texts[params.get('text')] += 1
+            return super().respond(method, params)
+
+    return RecordingBotApi()
+
+
+async def replay_callbacks(args, days):
+    from telegram import Update
+    from telegram.ext import DictPersistence
+
+    from benchmarks.loadtest import callback_update, message_update
+    from bot import build_application
+    from handlers.shifts import handled_callbacks
+
+    api = make_api()
+    application = build_application('123:bench', request=api,
+                                    persistence=DictPersistence())
+    update_ids = iter(range(1, 10 ** 9))
+
+    def to_update(data):
+        return Update.de_json(data, application.bot)
+
+    async def process(data):
+        update = to_update(data)
+        await application.update_processor.process_update(
+            update, application.process_update(update))
+
+    async def add_shift(owner, point_id, day):
+        for text in ('/addshift', str(point_id)):
+            await process(message_update(next(update_ids), owner, text))
+        tap = callback_update(next(update_ids), owner,
+                              f'cbcal_0_s_d_{day.year}_{day.month}'
+                              f'_{day.day}')
+        copies = [tap if index % 2 == 0 else callback_update(
+            next(update_ids), owner, tap['callback_query']['data'])
+            for index in range(args.repeats)]
+        # Straight to the application: the copies race in one chat.
+        await asyncio.gather(*(application.process_update(to_update(copy))
+                               for copy in copies))
+
+    start = time.perf_counter()
+    async with application:
+        await application.start()
+        for point_id, day in days:
+            await asyncio.gather(*(add_shift(owner, point_id, day)
+                                   for owner in range(1, args.owners + 1)))
+        await application.stop()
+    elapsed = time.perf_counter() - start
+    return api.texts, handled_callbacks.stats()['hits'], elapsed
+
+
+def insert_contest(args, days):
+    from handlers.shifts import insert_shift
+    from models import call_in_session
+
+    outcomes = Counter()
+    for point_id, day in days:
+        barrier = threading.Barrier(args.threads)
+        results = []
+
+        def insert():
+            barrier.wait()
+            try:
+                results.append(call_in_session(insert_shift, point_id,
+                                               day))
+            except Exception as error:
+                results.append(type(error).__name__)
+
+        threads = [threading.Thread(target=insert)
+                   for _ in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        created = [result for result in results if isinstance(result, int)]
+        if len(created) != 1:
+            sys.exit(f'point {point_id} on {day}: {len(created)} created,'
+                     f' {results}')
+        outcomes.update('created' if isinstance(result, int)
+                        else 'existing' if result is None else result
+                        for result in results)
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=200,
+                        help='point days to add through the handlers')
+    parser.add_argument('--owners', type=int, default=4,
+                        help='owners adding the same point day at once')
+    parser.add_argument('--repeats', type=int, default=6,
+                        help='copies of each final calendar tap')
+    parser.add_argument('--threads', type=int, default=16,
+                        help='threads inserting the same point day')
+    parser.add_argument('--points', type=int, default=50)
+    parser.add_argument('--database-url',
+                        help='empty database to use, a temporary SQLite'
+                             ' by default')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    os.environ['DATABASE_URL'] = args.database_url or (
+        f'sqlite:///{tempfile.mkdtemp(prefix="duplicates-")}/bench.db')
+    os.environ['OUTBOUND_GLOBAL_RATE'] = '0'
+    os.environ.setdefault('DB_POOL_SIZE', str(args.threads))
+
+    from migrations import migrate
+    from models import call_in_session
+
+    migrate()
+    call_in_session(seed, args)
+    logging.disable(logging.INFO)
+    today = datetime.date.today()
+    slots = [(index % args.points + 1,
+              today + datetime.timedelta(days=index // args.points + 1))
+             for index in range(args.days * 2)]
+    handler_days, contest_days = slots[:args.days], slots[args.days:]
+
+    texts, dropped, elapsed = asyncio.run(replay_callbacks(args,
+                                                           handler_days))
+    call_in_session(check_database, set(handler_days))
+    added = texts['Смена добавлена.']
+    if added != len(handler_days):
+        sys.exit(f'{added} "added" replies for {len(handler_days)} days')
+    taps = len(handler_days) * args.owners * args.repeats
+    print(f'handlers: {taps} final taps for {len(handler_days)} point days'
+          f' in {elapsed:.2f}s, one shift each')
+    print(f'  redeliveries dropped by callback id: {dropped}; replies: '
+          + ', '.join(f'"{text}"={count}'
+                      for text, count in texts.most_common()))
+
+    start = time.perf_counter()
+    outcomes = insert_contest(args, contest_days)
+    elapsed = time.perf_counter() - start
+    call_in_session(check_database, set(slots))
+    print(f'database: {len(contest_days) * args.threads} concurrent'
+          f' inserts for {len(contest_days)} point days in {elapsed:.2f}s,'
+          f' one shift each')
+    print('  outcomes: ' + ', '.join(
+        f'{name}={count}' for name, count in sorted(outcomes.items())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {
+    'id': 1000000000,
+    'is_bot': True,
+    'first_name': 'bench',
+    'username': 'bench_bot',
+}
+
+
+class FakeBotApi(BaseRequest):
+    """In-process stand-in for the Telegram Bot API.
+
+    Answers the methods the handlers call with minimal valid payloads,
+    optionally after an artificial network delay, and counts calls per
+    method.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _message(self, params: dict) -> dict:
+        self._message_id += 1
+        chat_id = int(params.get('chat_id') or 0)
+        return {
+            'message_id': int(params.get('message_id') or self._message_id),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', ''),
+        }
+
+    def respond(self, method: str, params: dict):
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            return self._message(params)
+        return True
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data else {}
+        result = self.respond(api_method, params)
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
@@ -0,0 +1,291 @@
+"""Offline load test: replays synthetic Updates through the real bot.
+
+Builds the Application from bot.py with all real handlers, answers Bot
+API calls with FakeBotApi and runs against a throwaway SQLite database
+(or an empty --database-url) seeded to the requested size. Reports
+throughput and p50/p95/p99 latency per command.
+
+    python -m benchmarks.loadtest --count 5000 --points 20000
+    python -m benchmarks.loadtest --count 5000 --dump updates.jsonl
+    python -m benchmarks.loadtest --replay updates.jsonl
+    python -m benchmarks.loadtest --persistence memory
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REGISTER_ID_BASE = 10 ** 7
+
+
+def message_update(update_id, user_id, text):
+    message = {
+        'message_id': update_id,
+        'date': 0,
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'user'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{
+            'type': 'bot_command',
+            'offset': 0,
+            'length': len(text.split()[0]),
+        }]
+    return {'update_id': update_id, 'message': message}
+
+
+def callback_update(update_id, user_id, data):
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'user'},
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': update_id,
+                'date': 0,
+                'chat': {'id': user_id, 'type': 'private'},
+                'text': '...',
+            },
+        },
+    }
+
+
+def generate(count, owners, points, seed=0):
+    """Yields (command, update dict) records, one scenario at a time.
+
+    Updates of one scenario are contiguous, so a chat never has two
+    conversations interleaved.
+    """
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    update_id = 0
+    registered = 0
+    produced = 0
+
+    def owner_of(point_id):
+        return (point_id - 1) % owners + 1
+
+    while produced < count:
+        scenario = rng.choices(
+            ['start', 'register', 'mypoints', 'schedule',
+             'addpoint', 'addshift'],
+            weights=[1, 2, 4, 4, 2, 3],
+        )[0]
+        owner = rng.randint(1, owners)
+        steps = []
+        if scenario == 'start':
+            steps.append(('start', 'msg', owner, '/start'))
+        elif scenario == 'register':
+            registered += 1
+            user_id = REGISTER_ID_BASE + registered
+            steps.append(('register', 'msg', user_id, '/register'))
+            steps.append(('register:role', 'cb', user_id,
+                          rng.choice(['reg_owner', 'reg_worker'])))
+        elif scenario == 'mypoints':
+            steps.append(('mypoints', 'msg', owner, '/mypoints'))
+        elif scenario == 'schedule':
+            text = '/schedule'
+            if points and rng.random() < 0.5:
+                text += f' {rng.randint(1, points)}'
+            steps.append(('schedule', 'msg', owner, text))
+        elif scenario == 'addpoint':
+            steps.append(('addpoint', 'msg', owner, '/addpoint'))
+            steps.append(('addpoint:name', 'msg', owner, f'ПВЗ {update_id}'))
+            steps.append(('addpoint:address', 'msg', owner,
+                          f'ул. Тестовая, {update_id}'))
+        elif scenario == 'addshift' and points:
+            point_id = rng.randint(1, points)
+            owner = owner_of(point_id)
+            day = today + datetime.timedelta(days=rng.randint(1, 60))
+            steps.append(('addshift', 'msg', owner, '/addshift'))
+            steps.append(('addshift:point', 'msg', owner, str(point_id)))
+            steps.append(('calendar', 'cb', owner,
+                          f'cbcal_0_s_m_{day.year}_{day.month}_1'))
+            steps.append(('calendar', 'cb', owner,
+                          f'cbcal_0_s_d_{day.year}_{day.month}_{day.day}'))
+        for command, kind, user_id, payload in steps:
+            update_id += 1
+            if kind == 'msg':
+                update = message_update(update_id, user_id, payload)
+            else:
+                update = callback_update(update_id, user_id, payload)
+            yield command, update
+            produced += 1
+
+
+def seed_database(owners, points, shifts, seed=0):
+    from sqlalchemy import insert
+
+    from migrations import migrate
+    from models import Point, Session, Shift, User
+
+    migrate()
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    chunk = 10000
+    session = Session()
+    try:
+        for start in range(1, owners + 1, chunk):
+            session.execute(insert(User), [
+                {'telegram_id': telegram_id, 'role': 'reg_owner'}
+                for telegram_id in range(start, min(start + chunk,
+                                                    owners + 1))
+            ])
+        for start in range(1, points + 1, chunk):
+            session.execute(insert(Point), [
+                {'name': f'ПВЗ {point_id}',
+                 'address': f'ул. Тестовая, {point_id}',
+                 'owner_id': (point_id - 1) % owners + 1}
+                for point_id in range(start, min(start + chunk, points + 1))
+            ])
+        # A point has at most one shift a day: draw distinct slots.
+        slots = rng.sample(range(points * 426), shifts)
+        for start in range(0, shifts, chunk):
+            session.execute(insert(Shift), [
+                {'point_id': slot % points + 1,
+                 'date': today + datetime.timedelta(
+                     days=slot // points - 365)}
+                for slot in slots[start:start + chunk]
+            ])
+        session.commit()
+    finally:
+        session.close()
+
+
+def percentile(values, fraction):
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+async def replay(application, records, concurrency):
+    from telegram import Update
+
+    latencies = defaultdict(list)
+    window = asyncio.Semaphore(concurrency)
+
+    async def run(command, update):
+        start = time.perf_counter()
+        try:
+            await application.update_processor.process_update(
+                update, application.process_update(update))
+        finally:
+            latencies[command].append(time.perf_counter() - start)
+            window.release()
+
+    tasks = []
+    started = time.perf_counter()
+    for command, data in records:
+        update = Update.de_json(data, application.bot)
+        await window.acquire()
+        tasks.append(asyncio.create_task(run(command, update)))
+    await asyncio.gather(*tasks)
+    return latencies, time.perf_counter() - started
+
+
+def report(latencies, elapsed, api_calls):
+    total = sum(len(values) for values in latencies.values())
+    print(f'{"command":<18}{"count":>8}{"p50 ms":>10}'
+          f'{"p95 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    for command in sorted(latencies):
+        values = sorted(latencies[command])
+        print(f'{command:<18}{len(values):>8}'
+              f'{percentile(values, 0.50) * 1000:>10.2f}'
+              f'{percentile(values, 0.95) * 1000:>10.2f}'
+              f'{percentile(values, 0.99) * 1000:>10.2f}'
+              f'{values[-1] * 1000:>10.2f}')
+    print(f'\n{total} updates in {elapsed:.2f}s '
+          f'({total / elapsed:.0f} updates/s)')
+    print('API calls: ' + ', '.join(
+        f'{method}={count}' for method, count in sorted(api_calls.items())))
+
+
+async def run_benchmark(args, records):
+    from telegram.ext import DictPersistence
+
+    from bot import build_application
+    from benchmarks.fake_bot_api import FakeBotApi
+    from persistence import SQLPersistence
+
+    request = FakeBotApi(latency=args.api_latency / 1000)
+    if args.persistence == 'memory':
+        persistence = DictPersistence(
+            update_interval=args.persistence_interval)
+    else:
+        persistence = SQLPersistence(
+            update_interval=args.persistence_interval)
+    application = build_application('123:bench', request=request,
+                                    persistence=persistence)
+    async with application:
+        await application.start()
+        latencies, elapsed = await replay(application, records,
+                                          args.concurrency)
+        await application.stop()
+    report(latencies, elapsed, request.calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=5000,
+                        help='number of synthetic updates to generate')
+    parser.add_argument('--replay', help='JSONL file of updates to replay')
+    parser.add_argument('--dump', help='write generated updates to JSONL')
+    parser.add_argument('--owners', type=int, default=1000)
+    parser.add_argument('--points', type=int, default=10000)
+    parser.add_argument('--shifts', type=int, default=100000)
+    parser.add_argument('--concurrency', type=int, default=64,
+                        help='maximum updates in flight')
+    parser.add_argument('--api-latency', type=float, default=0.0,
+                        help='simulated Bot API latency, ms')
+    parser.add_argument('--rate-limit', action='store_true',
+                        help='keep Telegram flood-control pacing enabled')
+    parser.add_argument('--persistence', choices=['sql', 'memory'],
+                        default='sql',
+                        help='conversation/user_data storage to use')
+    parser.add_argument('--persistence-interval', type=float, default=1.0,
+                        help='seconds between persistence flushes')
+    parser.add_argument('--database-url',
+                        help='empty database to seed, a temporary SQLite '
+                             'by default')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.replay:
+        with open(args.replay) as file:
+            records = [
+                (record['command'], record['update'])
+                for record in map(json.loads, file)
+            ]
+    else:
+        records = list(generate(args.count, args.owners, args.points,
+                                args.seed))
+    if args.dump:
+        with open(args.dump, 'w') as file:
+            for command, update in records:
+                file.write(json.dumps({'command': command,
+                                       'update': update}) + '\n')
+        return
+
+    os.environ['DATABASE_URL'] = args.database_url or (
+        f'sqlite:///{tempfile.mkdtemp(prefix="loadtest-")}/bench.db')
+    os.environ.setdefault('MAX_CONCURRENT_UPDATES', str(args.concurrency))
+    if not args.rate_limit:
+        os.environ['OUTBOUND_GLOBAL_RATE'] = '0'
+    sys.path.insert(0, ROOT)
+    seed_database(args.owners, args.points, args.shifts, args.seed)
+    logging.disable(logging.INFO)
+    asyncio.run(run_benchmark(args, records))
+
+
+if __name__ == '__main__':
+    main()
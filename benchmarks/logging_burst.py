@@ -0,0 +1,129 @@
+"""Event loop stalls caused by an error burst, per logging setup.
+
+A healthy coroutine ticks every millisecond and records how late each
+tick is, while failing coroutines raise from a few frames deep and log
+the traceback, --errors per second for --seconds. Output goes to a sink
+whose writes take --sink-ms (a busy disk or a full stderr pipe). Setups:
+
+    sync      StreamHandler and logger.error(traceback.format_exc())
+    queue     configure_logging() and logger.exception(), no sampling
+    sampled   the same with LOG_ERROR_SAMPLE_INTERVAL=60
+
+    python -m benchmarks.logging_burst --errors 2000 --sink-ms 1
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger('handlers.burst')
+
+
+class SlowSink:
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.writes = 0
+
+    def write(self, text: str) -> None:
+        self.writes += 1
+        time.sleep(self.delay)
+
+    def flush(self) -> None:
+        pass
+
+
+def fail(depth: int) -> None:
+    if depth:
+        fail(depth - 1)
+    raise ValueError('shift not found')
+
+
+async def failing(errors: int, seconds: float, use_exception: bool) -> None:
+    interval = seconds / errors
+    for _ in range(errors):
+        try:
+            fail(8)
+        except Exception:
+            if use_exception:
+                logger.exception('Failed to handle update')
+            else:
+                logger.error(traceback.format_exc())
+        await asyncio.sleep(interval)
+
+
+async def healthy(stop: asyncio.Event, lags: list) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - start - 0.001)
+
+
+async def burst(args, use_exception: bool) -> list:
+    lags = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(healthy(stop, lags))
+    await asyncio.gather(*(
+        failing(args.errors // args.tasks, args.seconds, use_exception)
+        for _ in range(args.tasks)
+    ))
+    stop.set()
+    await ticker
+    return lags
+
+
+def run(args, setup: str) -> None:
+    import logging_setup
+
+    sink = SlowSink(args.sink_ms / 1000)
+    root = logging.getLogger()
+    if setup == 'sync':
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(logging.Formatter(logging_setup.LOG_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+    else:
+        logging_setup.LOG_ERROR_SAMPLE_INTERVAL = (
+            60 if setup == 'sampled' else 0)
+        logging_setup.configure_logging('INFO', False, sink)
+    start = time.perf_counter()
+    lags = asyncio.run(burst(args, setup != 'sync'))
+    elapsed = time.perf_counter() - start
+    if setup == 'sync':
+        root.removeHandler(handler)
+    else:
+        logging_setup.stop_logging()
+    drained = time.perf_counter() - start
+    lags.sort()
+    print(f'{setup:<9}{statistics.median(lags) * 1000:>9.2f}'
+          f'{lags[int(len(lags) * 0.99)] * 1000:>9.2f}'
+          f'{lags[-1] * 1000:>9.1f}{elapsed:>9.2f}{drained:>9.2f}'
+          f'{sink.writes:>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--errors', type=int, default=2000)
+    parser.add_argument('--seconds', type=float, default=2.0,
+                        help='length of the burst')
+    parser.add_argument('--tasks', type=int, default=20,
+                        help='failing coroutines')
+    parser.add_argument('--sink-ms', type=float, default=1.0,
+                        help='time each write to the log output takes')
+    parser.add_argument('--setups', default='sync,queue,sampled')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    print(f'{"setup":<9}{"lag p50":>9}{"lag p99":>9}{"lag max":>9}'
+          f'{"burst s":>9}{"drain s":>9}{"writes":>8}')
+    for setup in args.setups.split(','):
+        run(args, setup)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Point search latency on a throwaway SQLite database.
+
+Seeds --points points through the normal insert path (so the search
+index is filled by its triggers), then times search_points for several
+kinds of queries typed into the inline search, with and without the
+owner filter. --compare-like also times the LIKE '%word%' scan the
+index replaces.
+
+    python -m benchmarks.point_search --points 100000 --queries 500
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BRANDS = ['Озон', 'Wildberries', 'Яндекс Маркет', 'СДЭК', 'Boxberry',
+          'Почта России', 'Ламода', 'DPD', 'ПЭК', 'Магнит Маркет']
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Екатеринбург',
+          'Новосибирск', 'Самара', 'Ростов-на-Дону', 'Пермь', 'Воронеж',
+          'Краснодар', 'Уфа', 'Тюмень', 'Омск', 'Челябинск', 'Тверь']
+STREETS = ['Ленина', 'Гагарина', 'Мира', 'Советская', 'Пушкина',
+           'Садовая', 'Лесная', 'Молодёжная', 'Школьная', 'Набережная',
+           'Центральная', 'Заводская', 'Строителей', 'Победы', 'Кирова',
+           'Чехова', 'Горького', 'Маяковского', 'Толстого', 'Лермонтова',
+           'Комсомольская', 'Первомайская', 'Октябрьская', 'Свободы',
+           'Береговая', 'Полевая', 'Луговая', 'Солнечная', 'Зелёная',
+           'Вокзальная']
+
+
+def point_row(rng, owner_id):
+    street = rng.choice(STREETS)
+    return {
+        'name': f'{rng.choice(BRANDS)} {street} {rng.randint(1, 999)}',
+        'address': f'{rng.choice(CITIES)}, ул. {street},'
+                   f' д. {rng.randint(1, 200)}',
+        'owner_id': owner_id,
+    }
+
+
+def seed(session, points, owners, rng):
+    from sqlalchemy import insert
+
+    from models import Point, User
+
+    session.execute(insert(User), [
+        {'telegram_id': owner_id, 'role': 'reg_owner'}
+        for owner_id in range(1, owners + 1)
+    ])
+    rows = [point_row(rng, rng.randint(1, owners)) for _ in range(points)]
+    for start in range(0, points, 10000):
+        session.execute(insert(Point), rows[start:start + 10000])
+    session.commit()
+    return rows
+
+
+def make_queries(rows, count, rng):
+    kinds = {
+        'street': lambda row: row['address'].split(', ')[1][4:],
+        'prefix 3': lambda row: row['address'].split(', ')[1][4:7],
+        'street + house': lambda row: ' '.join(
+            row['address'].split(', ')[1:]).replace('ул. ', ''),
+        'brand + street': lambda row: row['name'].rsplit(' ', 1)[0],
+        'city (broad)': lambda row: row['address'].split(', ')[0],
+        'ул (all match)': lambda row: 'ул',
+        'typo (no match)': lambda row: row['name'].split()[-2] + 'ъ',
+    }
+    return {kind: [make(rng.choice(rows)) for _ in range(count)]
+            for kind, make in kinds.items()}
+
+
+def measure(func, queries):
+    timings = []
+    found = 0
+    for query in queries:
+        start = time.perf_counter()
+        found += len(func(query))
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return (statistics.median(timings) * 1000,
+            timings[int(len(timings) * 0.95)] * 1000,
+            timings[-1] * 1000, found / len(queries))
+
+
+def like_search(session, query, limit):
+    from sqlalchemy import and_
+
+    from models import Point
+
+    # SQLite only folds ASCII case, so the words keep theirs.
+    return session.query(Point.id).filter(and_(*(
+        (Point.name + ' ' + Point.address).like(f'%{word}%')
+        for word in re.findall(r'\w+', query)
+    ))).limit(limit).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=100000)
+    parser.add_argument('--owners', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=500,
+                        help='queries per kind')
+    parser.add_argument('--compare-like', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    workdir = tempfile.mkdtemp(prefix='search-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{workdir}/bench.db'
+
+    from handlers.search import SEARCH_LIMIT, search_points
+    from migrations import migrate
+    from models import Session
+
+    migrate()
+    rng = random.Random(args.seed)
+    session = Session()
+    start = time.perf_counter()
+    rows = seed(session, args.points, args.owners, rng)
+    print(f'seeded {args.points} points with index triggers in'
+          f' {time.perf_counter() - start:.2f}s')
+
+    variants = [
+        ('fts', lambda query: search_points(session, query)),
+        ('fts, owner', lambda query: search_points(
+            session, query, rng.randint(1, args.owners))),
+    ]
+    if args.compare_like:
+        variants.append(('like scan', lambda query: like_search(
+            session, query, SEARCH_LIMIT)))
+    print(f'{"query":<16}{"variant":<12}{"p50 ms":>9}{"p95 ms":>9}'
+          f'{"max ms":>9}{"found":>7}')
+    for kind, queries in make_queries(rows, args.queries, rng).items():
+        for variant, func in variants:
+            p50, p95, worst, found = measure(func, queries)
+            print(f'{kind:<16}{variant:<12}{p50:>9.2f}{p95:>9.2f}'
+                  f'{worst:>9.2f}{found:>7.1f}')
+    session.close()
+
+
+if __name__ == '__main__':
+    main()
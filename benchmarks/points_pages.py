@@ -0,0 +1,130 @@
+"""/mypoints page latency as one owner's point count grows.
+
+Seeds --owners owners sharing --points points, plus one owner per
+entry of --sizes holding that many points, all with long names and
+addresses. For each of those owners, times fetching and rendering the
+first page, a page from the middle (by keyset cursor) and the last
+page (backward from past the end), and checks that every page fits in
+one Telegram message. Keyset pages on (owner_id, id) should take about
+the same time whatever the owner's point count.
+
+    python -m benchmarks.points_pages --sizes 100,10000,100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Telegram counts message length in UTF-16 code units.
+MESSAGE_LIMIT = 4096
+WORDS = ['Пункт', 'выдачи', 'заказов', 'Wildberries', 'Озон', 'Маркет',
+         'торговый', 'центр', 'Галерея', 'этаж', 'вход', 'со', 'двора',
+         '📦', 'улица', 'Большая', 'Садовая', 'корпус', 'строение']
+
+
+def long_text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed(session, args, rng):
+    from sqlalchemy import insert
+
+    from models import Point, User
+
+    owners = args.owners + len(args.sizes)
+    session.execute(insert(User), [
+        {'telegram_id': telegram_id, 'role': 'reg_owner'}
+        for telegram_id in range(1, owners + 1)
+    ])
+    owner_ids = [rng.randint(1, args.owners) for _ in range(args.points)]
+    for index, size in enumerate(args.sizes):
+        owner_ids += [args.owners + index + 1] * size
+    # Shuffled, so a big owner's points are spread over the table.
+    rng.shuffle(owner_ids)
+    for start in range(0, len(owner_ids), 10000):
+        session.execute(insert(Point), [
+            {'name': long_text(rng, 12), 'address': long_text(rng, 20),
+             'owner_id': owner_id}
+            for owner_id in owner_ids[start:start + 10000]
+        ])
+    session.commit()
+
+
+def page_cursors(session, owner_id):
+    from sqlalchemy import func
+
+    from models import Point
+
+    ids = session.query(Point.id).filter(Point.owner_id == owner_id)
+    middle = ids.order_by(Point.id).offset(ids.count() // 2).first()[0]
+    last = session.query(func.max(Point.id)).filter(
+        Point.owner_id == owner_id).scalar()
+    return [('first', None, False), ('middle', middle, False),
+            ('last', last + 1, True)]
+
+
+def measure(session, owner_id, cursor, backward, rounds):
+    from handlers.points import fetch_points_page, render_points
+
+    timings, longest = [], 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        rows, _ = fetch_points_page(session, owner_id, cursor, backward)
+        text = render_points(rows)
+        timings.append(time.perf_counter() - start)
+        longest = max(longest, len(text.encode('utf-16-le')) // 2)
+    timings.sort()
+    return (statistics.median(timings) * 1000,
+            timings[int(len(timings) * 0.95)] * 1000, longest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--owners', type=int, default=2000)
+    parser.add_argument('--points', type=int, default=40000,
+                        help='points spread over --owners')
+    parser.add_argument('--sizes', default='100,10000,100000',
+                        help='point counts of the measured owners')
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(',')]
+
+    sys.path.insert(0, ROOT)
+    workdir = tempfile.mkdtemp(prefix='points-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{workdir}/bench.db'
+
+    from migrations import migrate
+    from models import Session
+
+    migrate()
+    rng = random.Random(args.seed)
+    session = Session()
+    start = time.perf_counter()
+    seed(session, args, rng)
+    print(f'seeded {args.points + sum(args.sizes)} points in'
+          f' {time.perf_counter() - start:.2f}s')
+
+    print(f'{"points":>8}  {"page":<8}{"p50 ms":>9}{"p95 ms":>9}'
+          f'{"length":>8}')
+    too_long = False
+    for index, size in enumerate(args.sizes):
+        owner_id = args.owners + index + 1
+        for page, cursor, backward in page_cursors(session, owner_id):
+            p50, p95, longest = measure(session, owner_id, cursor,
+                                        backward, args.rounds)
+            too_long |= longest > MESSAGE_LIMIT
+            print(f'{size:>8}  {page:<8}{p50:>9.2f}{p95:>9.2f}'
+                  f'{longest:>8}')
+    session.close()
+    if too_long:
+        sys.exit(f'a page is longer than {MESSAGE_LIMIT} characters')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Throughput of the multi-process worker mode by number of workers.
+
+Seeds one SQLite database, then for each worker count copies it, starts
+a WorkerPool of real Applications answering through FakeBotApi and
+pushes the same synthetic updates through it as the receiver would.
+The clock runs from the first dispatched update until every worker has
+handled its share and stopped.
+
+    python -m benchmarks.sharding --count 5000 --workers 1,2,4
+"""
+import argparse
+import functools
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_application(api_latency, workers):
+    from bot import build_application
+    from benchmarks.fake_bot_api import FakeBotApi
+    from persistence import SQLPersistence
+
+    logging.disable(logging.INFO)
+    return build_application(
+        '123:bench', request=FakeBotApi(latency=api_latency),
+        persistence=SQLPersistence(update_interval=1.0), workers=workers)
+
+
+def run(workers, records, database, api_latency):
+    from telegram import Update
+
+    from sharding import WorkerPool
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    pool = WorkerPool(
+        functools.partial(make_application, api_latency, workers), workers)
+    pool.start()
+    pool.wait_ready()
+    start = time.perf_counter()
+    for _, data in records:
+        pool.dispatch(Update.de_json(data, None))
+    pool.close()
+    return time.perf_counter() - start, pool.dispatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=5000)
+    parser.add_argument('--workers', default='1,2,4',
+                        help='comma-separated worker counts to compare')
+    parser.add_argument('--owners', type=int, default=1000)
+    parser.add_argument('--points', type=int, default=10000)
+    parser.add_argument('--shifts', type=int, default=100000)
+    parser.add_argument('--api-latency', type=float, default=0.0,
+                        help='simulated Bot API latency, ms')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sharding-bench-')
+    template = os.path.join(workdir, 'template.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{template}'
+    os.environ['OUTBOUND_GLOBAL_RATE'] = '0'
+    os.environ['NOTIFY_INTERVAL'] = '0'
+    os.environ['REMINDER_WINDOW_HOURS'] = '0'
+    sys.path.insert(0, ROOT)
+
+    from benchmarks.loadtest import generate, seed_database
+    from models import engine
+
+    seed_database(args.owners, args.points, args.shifts, args.seed)
+    engine.dispose()
+    records = list(generate(args.count, args.owners, args.points,
+                            args.seed))
+
+    print(f'{"workers":>8}{"seconds":>10}{"updates/s":>12}{"speedup":>9}'
+          '  updates per worker')
+    baseline = None
+    for workers in map(int, args.workers.split(',')):
+        database = os.path.join(workdir, f'workers-{workers}.db')
+        shutil.copy(template, database)
+        elapsed, dispatched = run(workers, records, database,
+                                  args.api_latency / 1000)
+        rate = len(records) / elapsed
+        baseline = baseline or rate
+        print(f'{workers:>8}{elapsed:>10.2f}{rate:>12.0f}'
+              f'{rate / baseline:>8.2f}x  {dispatched}')
+
+
+if __name__ == '__main__':
+    main()
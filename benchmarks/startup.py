@@ -0,0 +1,94 @@
+"""Cold-start latency of the bot process, phase by phase.
+
+Every run is a fresh interpreter, as the Procfile worker starts, timing
+the import of bot, the migration of the database and the construction
+of the Application, plus the wall time of the whole process. The first
+run creates the schema in an empty database, the others find it up to
+date, as on a restart.
+
+    python -m benchmarks.startup --runs 10
+    python -m benchmarks.startup --imports 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = ('import', 'migrate', 'build')
+
+PROBE = f'''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {ROOT!r})
+import bot
+imported = time.perf_counter()
+from migrations import migrate
+migrate()
+migrated = time.perf_counter()
+bot.build_application('123:bench')
+built = time.perf_counter()
+print(json.dumps({{'import': imported - start,
+                  'migrate': migrated - imported,
+                  'build': built - migrated}}))
+'''
+
+
+def probe(env):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', PROBE], env=env,
+                            capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.splitlines()[-1])
+    timings['process'] = time.perf_counter() - start
+    return timings
+
+
+def slowest_imports(env, count):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import bot'],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(own), int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def row(label, runs):
+    cells = ''.join(
+        f'{statistics.median(run[phase] for run in runs) * 1000:>10.1f}'
+        for phase in PHASES + ('process',))
+    return f'{label:<22}{cells}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--imports', type=int, default=0,
+                        help='also list the N imports with most own time')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='startup-bench-')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{workdir}/bench.db')
+
+    runs = [probe(env) for _ in range(args.runs)]
+    print(f'{"median, ms":<22}'
+          + ''.join(f'{phase:>10}' for phase in PHASES + ('process',)))
+    print(row('empty database', runs[:1]))
+    if len(runs) > 1:
+        print(row(f'restart ({len(runs) - 1} runs)', runs[1:]))
+
+    if args.imports:
+        print(f'\n{"own, ms":>8}{"total, ms":>11}  module')
+        for own, cumulative, name in slowest_imports(env, args.imports):
+            print(f'{own / 1000:>8.1f}{cumulative / 1000:>11.1f}  {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,199 @@
-from telegram.ext import Application
+from functools import partial
+from typing import Optional
+
+from telegram.ext import Application, BasePersistence, Updater
+from telegram.request import BaseRequest, HTTPXRequest
 
 from handlers import (
     start_handler, reg_handler, reg_button_handler,
-    my_points_handler, add_point_conv_handler,
+    my_points_handler, my_points_page_handler, add_point_conv_handler,
     edit_point_conv_handler, delete_point_conv_handler,
-    schedule_handler, add_shift_conv_handler,
-    edit_shift_conv_handler, delete_shift_conv_handler,
+    schedule_handler, schedule_page_handler, add_shift_conv_handler,
+    add_shifts_handler, edit_shift_conv_handler, delete_shift_conv_handler,
+    open_shifts_handler, open_shifts_page_handler, claim_shift_handler,
+    stats_handler, point_search_handler,
+    review_handler, subscribe_handler, unsubscribe_handler,
+    export_points_handler, export_shifts_handler, import_document_handler,
+)
+from handlers.points import page_cache as points_page_cache
+from handlers.shifts import (
+    handled_callbacks, page_cache as schedule_page_cache,
+)
+from archiver import ShiftArchiver
+from handlers.users import user_cache
+from logging_setup import configure_logging, log_stats
+from metrics import (
+    TimedRequest, instrument, register_cache, register_component,
+    setup as setup_metrics, start_metrics_server,
 )
+from migrations import migrate
+from notifier import Notifier
+from persistence import SQLPersistence
+from rate_limiter import FloodControlRateLimiter
+from reminders import ReminderScheduler
+from settings import (
+    BOT_MODE, MAX_CONCURRENT_UPDATES, PERSISTENCE_INTERVAL, WEBHOOK_URL,
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, METRICS_HOST,
+    METRICS_PORT, SLOW_UPDATE_THRESHOLD, OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, NOTIFY_INTERVAL, NOTIFY_RATE,
+    NOTIFY_CONCURRENCY, NOTIFY_BATCH_SIZE, REMINDER_WINDOW_HOURS,
+    REMINDER_REFRESH_INTERVAL, ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL,
+    ARCHIVE_BATCH_SIZE, WORKER_PROCESSES,
+)
+from sharding import run_sharded
 from telegram_token import TELEGRAM_TOKEN
+from update_processor import ChatOrderedUpdateProcessor
 
 
-def main() -> None:
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+def build_application(
+    token: str = TELEGRAM_TOKEN,
+    request: Optional[BaseRequest] = None,
+    persistence: Optional[BasePersistence] = None,
+    workers: int = 1,
+) -> Application:
+    """Builds the bot; with workers > 1, one of that many worker processes.
+
+    Workers get no Updater, since the receiver in sharding.py fetches
+    the updates, and an equal share of the global outbound rate, since
+    they all send as the same bot.
+    """
+    if request is None:
+        request = HTTPXRequest(connection_pool_size=256)
+    if persistence is None:
+        persistence = SQLPersistence(update_interval=PERSISTENCE_INTERVAL)
+    builder = (
+        Application.builder()
+        .token(token)
+        .request(TimedRequest(request))
+        .persistence(persistence)
+        .concurrent_updates(
+            ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+    )
+    if workers > 1:
+        builder = builder.updater(None)
+    if OUTBOUND_GLOBAL_RATE > 0:
+        rate_limiter = FloodControlRateLimiter(
+            overall_rate=OUTBOUND_GLOBAL_RATE / workers,
+            per_chat_rate=OUTBOUND_CHAT_RATE,
+            per_chat_burst=OUTBOUND_CHAT_BURST,
+        )
+        builder = builder.rate_limiter(rate_limiter)
+        register_component('outbound', rate_limiter)
+    background_jobs = []
+    if NOTIFY_INTERVAL > 0:
+        notifier = Notifier(
+            interval=NOTIFY_INTERVAL,
+            rate=NOTIFY_RATE,
+            concurrency=NOTIFY_CONCURRENCY,
+            batch_size=NOTIFY_BATCH_SIZE,
+        )
+        background_jobs.append(notifier)
+        register_component('notifier', notifier)
+    if REMINDER_WINDOW_HOURS > 0:
+        reminder_scheduler = ReminderScheduler(
+            window_hours=REMINDER_WINDOW_HOURS,
+            refresh_interval=REMINDER_REFRESH_INTERVAL,
+            rate=NOTIFY_RATE,
+            concurrency=NOTIFY_CONCURRENCY,
+        )
+        background_jobs.append(reminder_scheduler)
+        register_component('reminders', reminder_scheduler)
+    if ARCHIVE_AFTER_DAYS > 0:
+        archiver = ShiftArchiver(
+            after_days=ARCHIVE_AFTER_DAYS,
+            interval=ARCHIVE_INTERVAL,
+            batch_size=ARCHIVE_BATCH_SIZE,
+        )
+        background_jobs.append(archiver)
+        register_component('archiver', archiver)
+
+    async def start_background_jobs(application: Application) -> None:
+        for job in background_jobs:
+            await job.start(application)
+
+    async def stop_background_jobs(application: Application) -> None:
+        for job in background_jobs:
+            await job.stop(application)
+
+    builder = builder.post_init(start_background_jobs)
+    builder = builder.post_stop(stop_background_jobs)
+    application = builder.build()
+
+    setup_metrics(SLOW_UPDATE_THRESHOLD)
+    register_component('logging', log_stats)
+    register_cache('users', user_cache)
+    register_cache('points_pages', points_page_cache)
+    register_cache('schedule_pages', schedule_page_cache)
+    register_cache('shift_callbacks', handled_callbacks)
 
-    application.add_handler(start_handler)
-    application.add_handler(reg_handler)
-    application.add_handler(reg_button_handler)
+    application.add_handler(instrument(start_handler))
+    application.add_handler(instrument(reg_handler))
+    application.add_handler(instrument(reg_button_handler))
 
-    application.add_handler(my_points_handler)
-    application.add_handler(add_point_conv_handler)
-    application.add_handler(edit_point_conv_handler)
-    application.add_handler(delete_point_conv_handler)
+    application.add_handler(instrument(my_points_handler))
+    application.add_handler(instrument(my_points_page_handler))
+    application.add_handler(instrument(add_point_conv_handler))
+    application.add_handler(instrument(edit_point_conv_handler))
+    application.add_handler(instrument(delete_point_conv_handler))
+
+    application.add_handler(instrument(schedule_handler))
+    application.add_handler(instrument(schedule_page_handler))
+    application.add_handler(instrument(add_shift_conv_handler))
+    application.add_handler(instrument(add_shifts_handler))
+    application.add_handler(instrument(edit_shift_conv_handler))
+    application.add_handler(instrument(delete_shift_conv_handler))
+    application.add_handler(instrument(open_shifts_handler))
+    application.add_handler(instrument(open_shifts_page_handler))
+    application.add_handler(instrument(claim_shift_handler))
+    application.add_handler(instrument(stats_handler))
+    application.add_handler(instrument(point_search_handler))
+
+    application.add_handler(instrument(review_handler))
+    application.add_handler(instrument(subscribe_handler))
+    application.add_handler(instrument(unsubscribe_handler))
+
+    application.add_handler(instrument(export_points_handler))
+    application.add_handler(instrument(export_shifts_handler))
+    application.add_handler(instrument(import_document_handler))
+
+    return application
+
+
+async def start_updater(updater: Updater) -> None:
+    if BOT_MODE == 'webhook':
+        await updater.start_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        await updater.start_polling()
+
+
+def main() -> None:
+    configure_logging()
+    migrate()
+    if WORKER_PROCESSES > 1:
+        run_sharded(partial(build_application, workers=WORKER_PROCESSES),
+                    WORKER_PROCESSES, TELEGRAM_TOKEN, start_updater)
+        return
 
-    application.add_handler(schedule_handler)
-    application.add_handler(add_shift_conv_handler)
-    application.add_handler(edit_shift_conv_handler)
-    application.add_handler(delete_shift_conv_handler)
+    application = build_application()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_HOST, METRICS_PORT)
 
-    application.run_polling()
+    if BOT_MODE == 'webhook':
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        application.run_polling()
 
 
 if __name__ == '__main__':
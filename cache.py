@@ -0,0 +1,76 @@
+import functools
+import time
+from collections import OrderedDict
+
+replicated_functions = {}
+replicator = None
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None or item[1] < time.monotonic():
+            self._data.pop(key, None)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def set(self, key, value) -> None:
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key) -> None:
+        self._data.pop(key, None)
+
+    def invalidate_where(self, predicate) -> None:
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+def replicated(func):
+    """Marks a cache invalidation that other worker processes must repeat.
+
+    The wrapped function runs locally as usual; when a replicator is
+    set (multi-process mode), its name and arguments are published too,
+    and the other processes call it through apply_replicated.
+    """
+    name = f'{func.__module__}.{func.__qualname__}'
+    replicated_functions[name] = func
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        func(*args)
+        if replicator is not None:
+            replicator(name, args)
+    return wrapper
+
+
+def set_replicator(publish) -> None:
+    global replicator
+    replicator = publish
+
+
+def apply_replicated(name: str, args: tuple) -> None:
+    replicated_functions[name](*args)
@@ -1,17 +1,31 @@
 from .users import start_handler, reg_handler, reg_button_handler
 from .points import (
-    my_points_handler, add_point_conv_handler,
+    my_points_handler, my_points_page_handler, add_point_conv_handler,
     edit_point_conv_handler, delete_point_conv_handler,
 )
 from .shifts import (
-    schedule_handler, add_shift_conv_handler,
-    edit_shift_conv_handler, delete_shift_conv_handler,
+    schedule_handler, schedule_page_handler, add_shift_conv_handler,
+    add_shifts_handler, edit_shift_conv_handler, delete_shift_conv_handler,
+    open_shifts_handler, open_shifts_page_handler, claim_shift_handler,
+)
+from .stats import stats_handler
+from .search import point_search_handler
+from .reviews import review_handler
+from .subscriptions import subscribe_handler, unsubscribe_handler
+from .documents import (
+    export_points_handler, export_shifts_handler, import_document_handler,
 )
 
 __all__ = [
     'start_handler', 'reg_handler', 'reg_button_handler',
-    'my_points_handler', 'add_point_conv_handler',
+    'my_points_handler', 'my_points_page_handler', 'add_point_conv_handler',
     'edit_point_conv_handler', 'delete_point_conv_handler',
-    'schedule_handler', 'add_shift_conv_handler',
-    'edit_shift_conv_handler', 'delete_shift_conv_handler',
+    'schedule_handler', 'schedule_page_handler', 'add_shift_conv_handler',
+    'add_shifts_handler', 'edit_shift_conv_handler',
+    'delete_shift_conv_handler',
+    'open_shifts_handler', 'open_shifts_page_handler', 'claim_shift_handler',
+    'stats_handler', 'point_search_handler',
+    'review_handler', 'subscribe_handler', 'unsubscribe_handler',
+    'export_points_handler', 'export_shifts_handler',
+    'import_document_handler',
 ]
@@ -0,0 +1,59 @@
+import datetime
+import functools
+
+CALENDAR_CACHE_SIZE = 512
+
+# Callback data format of telegram_bot_calendar (calendar_id 0). Kept
+# here so that only drawing a keyboard imports the library.
+CB_CALENDAR = 'cbcal'
+YEAR, MONTH, DAY = 'y', 'm', 'd'
+SELECT, GOTO, NOTHING = 's', 'g', 'n'
+STEPS = {YEAR: MONTH, MONTH: DAY}
+CALENDAR_PATTERN = f'^{CB_CALENDAR}_0_'
+
+
+@functools.lru_cache(maxsize=CALENDAR_CACHE_SIZE)
+def calendar_keyboard(step, year, month, locale):
+    from telegram_bot_calendar import DetailedTelegramCalendar
+
+    calendar = DetailedTelegramCalendar(locale=locale)
+    _, keyboard, _ = calendar.process(
+        f'{CB_CALENDAR}_0_{GOTO}_{step}_{year}_{month}_1')
+    return keyboard
+
+
+class ShiftDatePicker:
+    """Drop-in for DetailedTelegramCalendar's build() and process().
+
+    Callback data is decoded directly and keyboards are memoized per
+    (step, year, month, locale), so a calendar tap does not construct a
+    calendar object. Year and month pages do not depend on the month,
+    and day pages do not depend on the day, so those parts are dropped
+    from the cache key.
+    """
+
+    def __init__(self, locale: str = 'en') -> None:
+        self.locale = locale
+
+    def keyboard(self, step, year, month):
+        return calendar_keyboard(step, year, month if step == DAY else 1,
+                                 self.locale)
+
+    def build(self):
+        return self.keyboard(YEAR, datetime.date.today().year, 1), YEAR
+
+    def process(self, call_data):
+        params = call_data.split('_')
+        action = params[2]
+        if action == NOTHING:
+            return None, None, None
+        step = params[3]
+        year, month, day = map(int, params[4:7])
+        if action == GOTO:
+            return None, self.keyboard(step, year, month), step
+        if action == SELECT:
+            if step in STEPS:
+                next_step = STEPS[step]
+                return None, self.keyboard(next_step, year, month), next_step
+            return datetime.date(year, month, day), None, step
+        return None, None, None
@@ -0,0 +1,200 @@
+import csv
+import datetime
+import io
+import itertools
+import logging
+import os
+import tempfile
+
+from sqlalchemy import insert
+from telegram import Update
+from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters
+
+from models import ArchivedShift, Point, Shift, run_in_session
+from .points import invalidate_points
+from .shifts import insert_new_shifts, invalidate_all_schedules
+from .users import get_user
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 5
+
+POINT_COLUMNS = ['name', 'address']
+SHIFT_COLUMNS = ['point_id', 'date']
+
+
+def write_csv(file, header, rows):
+    text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(header)
+    writer.writerows(rows)
+    text.flush()
+    text.detach()
+    file.seek(0)
+
+
+def export_points(session, owner_id, file):
+    rows = (
+        session.query(Point.id, Point.name, Point.address, Point.rating)
+        .filter(Point.owner_id == owner_id)
+        .order_by(Point.id)
+        .yield_per(EXPORT_CHUNK_SIZE)
+    )
+    write_csv(file, ['id', 'name', 'address', 'rating'], rows)
+
+
+def export_shifts(session, owner_id, file):
+    """Writes archived shifts, then current ones, each by date."""
+    rows = itertools.chain.from_iterable(
+        session.query(model.id, model.point_id, model.date, model.worker_id)
+        .join(Point, Point.id == model.point_id)
+        .filter(Point.owner_id == owner_id)
+        .order_by(model.date, model.id)
+        .yield_per(EXPORT_CHUNK_SIZE)
+        for model in (ArchivedShift, Shift)
+    )
+    write_csv(file, ['id', 'point_id', 'date', 'worker_id'], rows)
+
+
+def cell(row, column):
+    # DictReader fills the columns missing from a short row with None.
+    return (row[column] or '').strip()
+
+
+def parse_point_row(row, owner_id, context):
+    name, address = cell(row, 'name'), cell(row, 'address')
+    if not name or not address:
+        raise ValueError('пустое название или адрес')
+    return {'name': name, 'address': address, 'owner_id': owner_id}
+
+
+def parse_shift_row(row, owner_id, context):
+    point_id = int(cell(row, 'point_id'))
+    if point_id not in context['point_ids']:
+        raise ValueError(f'пункт выдачи {point_id} не найден')
+    date = datetime.date.fromisoformat(cell(row, 'date'))
+    return {'point_id': point_id, 'date': date}
+
+
+def flush_points(session, rows):
+    session.execute(insert(Point), rows)
+    session.commit()
+    return len(rows)
+
+
+def flush_shifts(session, rows):
+    created = insert_new_shifts(session, rows)
+    session.commit()
+    return len(created)
+
+
+def import_csv(session, owner_id, path):
+    """Streams a CSV file into points or shifts, chosen by its header.
+
+    Rows are validated one at a time and inserted in chunks of
+    IMPORT_CHUNK_SIZE, each in its own transaction. Returns the table
+    name, the number of inserted rows and a list of row errors.
+    """
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        reader = csv.DictReader(file)
+        columns = set(reader.fieldnames or [])
+        context = {}
+        if set(SHIFT_COLUMNS) <= columns:
+            table, parse_row, flush = 'shifts', parse_shift_row, flush_shifts
+            context['point_ids'] = {
+                point_id for point_id, in session.query(Point.id).filter(
+                    Point.owner_id == owner_id)
+            }
+        elif set(POINT_COLUMNS) <= columns:
+            table, parse_row, flush = 'points', parse_point_row, flush_points
+        else:
+            return None, 0, []
+
+        inserted, errors, chunk = 0, [], []
+        for row in reader:
+            try:
+                chunk.append(parse_row(row, owner_id, context))
+            except (KeyError, TypeError, ValueError) as error:
+                errors.append((reader.line_num, str(error)))
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                inserted += flush(session, chunk)
+                chunk = []
+        if chunk:
+            inserted += flush(session, chunk)
+    return table, inserted, errors
+
+
+async def send_export(update: Update, export, filename: str) -> None:
+    try:
+        user = await get_user(update.message.from_user.id)
+        if not user or user[1] != 'reg_owner':
+            await update.message.reply_text('Нет прав на выгрузку данных.')
+            return
+        with tempfile.TemporaryFile() as file:
+            await run_in_session(export, user[0], file)
+            await update.message.reply_document(document=file,
+                                                filename=filename)
+    except Exception:
+        logger.exception('Failed to handle update')
+        await update.message.reply_text('Некорректный запрос на'
+                                        ' выгрузку данных.')
+
+
+async def export_points_command(update: Update,
+                                context: ContextTypes.DEFAULT_TYPE) -> None:
+    await send_export(update, export_points, 'points.csv')
+
+
+async def export_shifts_command(update: Update,
+                                context: ContextTypes.DEFAULT_TYPE) -> None:
+    await send_export(update, export_shifts, 'shifts.csv')
+
+
+async def import_document(update: Update,
+                          context: ContextTypes.DEFAULT_TYPE) -> None:
+    path = None
+    try:
+        user = await get_user(update.message.from_user.id)
+        if not user or user[1] != 'reg_owner':
+            await update.message.reply_text('Нет прав на загрузку данных.')
+            return
+        file = await update.message.document.get_file()
+        descriptor, path = tempfile.mkstemp(suffix='.csv')
+        os.close(descriptor)
+        await file.download_to_drive(path)
+
+        table, inserted, errors = await run_in_session(import_csv,
+                                                       user[0], path)
+        if table is None:
+            await update.message.reply_text(
+                'Не удалось определить формат файла. Ожидаются столбцы '
+                f'{",".join(POINT_COLUMNS)} или {",".join(SHIFT_COLUMNS)}.'
+            )
+            return
+        if table == 'points':
+            invalidate_points(user[0])
+        else:
+            invalidate_all_schedules()
+
+        text = f'Загружено записей: {inserted}.'
+        if errors:
+            text += f' Строк с ошибками: {len(errors)}.\n' + '\n'.join(
+                f'Строка {line}: {error}'
+                for line, error in errors[:MAX_REPORTED_ERRORS]
+            )
+        await update.message.reply_text(text)
+    except Exception:
+        logger.exception('Failed to handle update')
+        await update.message.reply_text('Некорректный запрос на'
+                                        ' загрузку данных.')
+    finally:
+        if path:
+            os.remove(path)
+
+
+export_points_handler = CommandHandler('exportpoints', export_points_command)
+export_shifts_handler = CommandHandler('exportshifts', export_shifts_command)
+import_document_handler = MessageHandler(
+    filters.Document.FileExtension('csv'), import_document)
@@ -1,45 +1,144 @@
-import traceback
 import logging
-import prettytable
 
-from telegram import Update, ReplyKeyboardRemove
+from telegram import (
+    Update, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup,
+)
 from telegram.ext import (
     ContextTypes, MessageHandler, ConversationHandler,
-    CommandHandler, filters,
+    CommandHandler, CallbackQueryHandler, filters,
 )
 from telegram.constants import ParseMode
 
-from models import User, Point, Session
+from cache import TTLCache, replicated
+from models import Point, ShiftStats, run_in_session
+from .search import search_keyboard
+from .shifts import invalidate_point_schedules
+from .users import get_user
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 (POINT_NAME, POINT_ADDRESS, POINT_ID, POINT_NEW_NAME,
  POINT_NEW_ADDRESS) = range(5)
 
+POINTS_PAGE_SIZE = 20
+# Keeps a full page of the widest rows within one Telegram message.
+POINT_FIELD_WIDTH = 32
+PAGE_CACHE_SIZE = 1000
+PAGE_CACHE_TTL = 600
+
+page_cache = TTLCache(PAGE_CACHE_SIZE, PAGE_CACHE_TTL)
+
+
+def fetch_points_page(session, owner_id, cursor=None, backward=False):
+    query = session.query(Point.id, Point.name, Point.address, Point.rating)
+    query = query.filter(Point.owner_id == owner_id)
+    if cursor:
+        if backward:
+            query = query.filter(Point.id < cursor)
+        else:
+            query = query.filter(Point.id > cursor)
+    if backward:
+        query = query.order_by(Point.id.desc())
+    else:
+        query = query.order_by(Point.id)
+    rows = [tuple(row) for row in query.limit(POINTS_PAGE_SIZE + 1)]
+    more = len(rows) > POINTS_PAGE_SIZE
+    rows = rows[:POINTS_PAGE_SIZE]
+    if backward:
+        rows.reverse()
+    return rows, more
+
+
+def points_keyboard(rows, has_prev, has_next):
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(
+            '« Назад', callback_data=f'points:p:{rows[0][0]}'))
+    if has_next:
+        buttons.append(InlineKeyboardButton(
+            'Вперед »', callback_data=f'points:n:{rows[-1][0]}'))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+def shorten(value):
+    if not value:
+        return value
+    value = ' '.join(value.split())
+    if len(value) > POINT_FIELD_WIDTH:
+        value = value[:POINT_FIELD_WIDTH - 1] + '…'
+    return value
+
+
+def render_points(rows):
+    import prettytable
+
+    table = prettytable.PrettyTable(['id', 'name', 'address', 'rating'])
+    for point_id, name, address, rating in rows:
+        table.add_row([point_id, shorten(name), shorten(address), rating])
+    return f'```{table}```'
+
+
+def insert_point(session, name, address, owner_id):
+    session.add(Point(name=name, address=address, owner_id=owner_id))
+    session.commit()
+
+
+def update_point(session, point_id, name, address):
+    point = session.query(Point).filter_by(id=point_id).first()
+    if not point:
+        return None
+    point.name = name
+    point.address = address
+    session.commit()
+    return point.owner_id
+
+
+def remove_point(session, point_id):
+    point = session.query(Point).filter_by(id=point_id).first()
+    if not point:
+        return None
+    owner_id = point.owner_id
+    session.query(ShiftStats).filter_by(point_id=point_id).delete()
+    session.delete(point)
+    session.commit()
+    return owner_id
+
+
+async def load_points_page(owner_id, cursor=None, backward=False):
+    key = (owner_id, cursor, backward)
+    page = page_cache.get(key)
+    if page is None:
+        rows, more = await run_in_session(fetch_points_page, owner_id,
+                                          cursor, backward)
+        if rows:
+            if backward:
+                has_prev, has_next = more, True
+            else:
+                has_prev, has_next = cursor is not None, more
+            page = (render_points(rows),
+                    points_keyboard(rows, has_prev, has_next))
+        else:
+            page = (None, None)
+        page_cache.set(key, page)
+    return page
+
+
+@replicated
+def invalidate_points(owner_id):
+    page_cache.invalidate_where(lambda key: key[0] == owner_id)
+
 
 async def my_points(update: Update,
                     context: ContextTypes.DEFAULT_TYPE) -> None:
-    session = Session()
     try:
-        telegram_id = update.message.from_user.id
-        user = session.query(User).filter_by(
-            telegram_id=telegram_id).first()
-        if user and user.role == 'reg_owner':
-            points = session.query(Point).all()
-            if points:
-                table = prettytable.PrettyTable(['id', 'name',
-                                                 'address', 'rating'])
-                for point in points:
-                    table.add_row([
-                        point.id,
-                        point.name,
-                        point.address,
-                        point.rating,
-                    ])
+        user = await get_user(update.message.from_user.id)
+        if user and user[1] == 'reg_owner':
+            text, keyboard = await load_points_page(user[0])
+            if text:
                 await update.message.reply_text(
-                    f'```{table}```',
-                    parse_mode=ParseMode.MARKDOWN_V2
+                    text,
+                    parse_mode=ParseMode.MARKDOWN_V2,
+                    reply_markup=keyboard,
                 )
             else:
                 await update.message.reply_text(
@@ -50,21 +149,46 @@ async def my_points(update: Update,
                 'У вас нет доступа к просмотру пунктов выдачи.'
             )
     except Exception:
-        logger.error(traceback.format_exc())
+        logger.exception('Failed to handle update')
         await update.message.reply_text('Некорректный запрос на просмотр'
                                         ' пунктов выдачи.')
-    finally:
-        session.close()
+
+
+async def my_points_page(update: Update,
+                         context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    try:
+        user = await get_user(query.from_user.id)
+        if user and user[1] == 'reg_owner':
+            _, direction, point_id = query.data.split(':')
+            text, keyboard = await load_points_page(
+                user[0], int(point_id), direction == 'p')
+            if text:
+                await query.message.edit_text(
+                    text,
+                    parse_mode=ParseMode.MARKDOWN_V2,
+                    reply_markup=keyboard,
+                )
+            else:
+                await query.message.edit_text(
+                    'Список ваших пунктов выдачи пуст.'
+                )
+        else:
+            await query.message.edit_text(
+                'У вас нет доступа к просмотру пунктов выдачи.'
+            )
+    except Exception:
+        logger.exception('Failed to handle update')
+        await query.message.edit_text('Некорректный запрос на просмотр'
+                                      ' пунктов выдачи.')
 
 
 async def add_point_start(update: Update,
                           context: ContextTypes.DEFAULT_TYPE) -> int:
-    session = Session()
-    telegram_id = update.message.from_user.id
-    user = session.query(User).filter_by(telegram_id=telegram_id).first()
-    session.close()
+    user = await get_user(update.message.from_user.id)
 
-    if user and user.role == 'reg_owner':
+    if user and user[1] == 'reg_owner':
         await update.message.reply_text('Введите название пункта выдачи:')
         return POINT_NAME
     else:
@@ -83,16 +207,13 @@ async def add_point_name(update: Update,
 async def add_point_address(update: Update,
                             context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data['address'] = update.message.text
-    session = Session()
     try:
-        telegram_id = update.message.from_user.id
-        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        user = await get_user(update.message.from_user.id)
         if user:
             name = context.user_data['name']
             address = context.user_data['address']
-            point = Point(name=name, address=address, owner_id=user.id)
-            session.add(point)
-            session.commit()
+            await run_in_session(insert_point, name, address, user[0])
+            invalidate_points(user[0])
             await update.message.reply_text(
                 f'Пункт выдачи "{name}" по адресу "{address}" добавлен.',
                 reply_markup=ReplyKeyboardRemove(),
@@ -100,24 +221,20 @@ async def add_point_address(update: Update,
         else:
             await update.message.reply_text('Ошибка добавления пункта выдачи.')
     except Exception:
-        logger.error(traceback.format_exc())
+        logger.exception('Failed to handle update')
         await update.message.reply_text('Некорректный запрос на'
                                         ' добавление пункта выдачи.')
-    finally:
-        session.close()
     return ConversationHandler.END
 
 
 async def edit_point_start(update: Update,
                            context: ContextTypes.DEFAULT_TYPE) -> int:
-    session = Session()
-    telegram_id = update.message.from_user.id
-    user = session.query(User).filter_by(telegram_id=telegram_id).first()
-    session.close()
+    user = await get_user(update.message.from_user.id)
 
-    if user and user.role == 'reg_owner':
+    if user and user[1] == 'reg_owner':
         await update.message.reply_text('Введите ID пункта выдачи, который'
-                                        ' хотите изменить:')
+                                        ' хотите изменить:',
+                                        reply_markup=search_keyboard())
         return POINT_ID
     else:
         await update.message.reply_text('Вы не имеете права редактировать'
@@ -142,21 +259,19 @@ async def edit_point_new_name(update: Update,
 async def edit_point_new_address(update: Update,
                                  context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data['new_address'] = update.message.text
-    session = Session()
     try:
-        telegram_id = update.message.from_user.id
-        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        user = await get_user(update.message.from_user.id)
         if user:
             point_id = context.user_data['id']
             new_name = context.user_data['new_name']
             new_address = context.user_data['new_address']
 
-            point = session.query(Point).filter_by(id=point_id).first()
-            if point:
-                point.name = new_name
-                point.address = new_address
-                session.add(point)
-                session.commit()
+            owner_id = await run_in_session(update_point, point_id,
+                                            new_name, new_address)
+            if owner_id is not None:
+                invalidate_points(owner_id)
+                # Its shifts stay, with point_id set to NULL.
+                invalidate_point_schedules(int(point_id))
                 await update.message.reply_text(
                     f'Пункт выдачи "{point_id}" изменен на "{new_name}" '
                     f'по адресу "{new_address}".',
@@ -169,24 +284,20 @@ async def edit_point_new_address(update: Update,
             await update.message.reply_text('Ошибка редактирования пункта'
                                             ' выдачи.')
     except Exception:
-        logger.error(traceback.format_exc())
+        logger.exception('Failed to handle update')
         await update.message.reply_text('Некорректный запрос на'
                                         ' редактирование пункта выдачи.')
-    finally:
-        session.close()
     return ConversationHandler.END
 
 
 async def delete_point_start(update: Update,
                              context: ContextTypes.DEFAULT_TYPE) -> int:
-    session = Session()
-    telegram_id = update.message.from_user.id
-    user = session.query(User).filter_by(telegram_id=telegram_id).first()
-    session.close()
+    user = await get_user(update.message.from_user.id)
 
-    if user and user.role == 'reg_owner':
+    if user and user[1] == 'reg_owner':
         await update.message.reply_text('Введите ID пункта выдачи,'
-                                        ' который хотите удалить:')
+                                        ' который хотите удалить:',
+                                        reply_markup=search_keyboard())
         return POINT_ID
     else:
         await update.message.reply_text('Вы не имеете права удалять'
@@ -197,15 +308,14 @@ async def delete_point_start(update: Update,
 async def delete_point_id(update: Update,
                           context: ContextTypes.DEFAULT_TYPE) -> int:
     point_id = update.message.text
-    session = Session()
     try:
-        telegram_id = update.message.from_user.id
-        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        user = await get_user(update.message.from_user.id)
         if user:
-            point = session.query(Point).filter_by(id=point_id).first()
-            if point:
-                session.delete(point)
-                session.commit()
+            owner_id = await run_in_session(remove_point, point_id)
+            if owner_id is not None:
+                invalidate_points(owner_id)
+                # Its shifts stay, with point_id set to NULL.
+                invalidate_point_schedules(int(point_id))
                 await update.message.reply_text(
                     f'Пункт выдачи "{point_id}" удален.',
                     reply_markup=ReplyKeyboardRemove(),
@@ -216,11 +326,9 @@ async def delete_point_id(update: Update,
         else:
             await update.message.reply_text('Ошибка удаления пункта выдачи.')
     except Exception:
-        logger.error(traceback.format_exc())
+        logger.exception('Failed to handle update')
         await update.message.reply_text('Некорректный запрос на'
                                         ' удаление пункта выдачи.')
-    finally:
-        session.close()
     return ConversationHandler.END
 
 
@@ -231,6 +339,8 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 
 my_points_handler = CommandHandler('mypoints',  my_points)
+my_points_page_handler = CallbackQueryHandler(my_points_page,
+                                              pattern=r'^points:')
 add_point_conv_handler = ConversationHandler(
     entry_points=[CommandHandler('addpoint', add_point_start)],
     states={
@@ -240,6 +350,8 @@ add_point_conv_handler = ConversationHandler(
             filters.TEXT & ~filters.COMMAND, add_point_address)],
     },
     fallbacks=[CommandHandler('cancel', cancel)],
+    name='add_point',
+    persistent=True,
 )
 edit_point_conv_handler = ConversationHandler(
     entry_points=[CommandHandler('editpoint', edit_point_start)],
@@ -252,6 +364,8 @@ edit_point_conv_handler = ConversationHandler(
             filters.TEXT & ~filters.COMMAND, edit_point_new_address)],
     },
     fallbacks=[CommandHandler('cancel', cancel)],
+    name='edit_point',
+    persistent=True,
 )
 delete_point_conv_handler = ConversationHandler(
     entry_points=[CommandHandler('deletepoint', delete_point_start)],
@@ -260,4 +374,6 @@ delete_point_conv_handler = ConversationHandler(
             filters.TEXT & ~filters.COMMAND, delete_point_id)],
     },
     fallbacks=[CommandHandler('cancel', cancel)],
+    name='delete_point',
+    persistent=True,
 )
@@ -0,0 +1,126 @@
+import datetime
+import logging
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from telegram import Update
+from telegram.ext import ContextTypes, CommandHandler
+
+from models import (
+    ArchivedShift, Point, Review, Shift, User, run_in_session,
+)
+from .points import invalidate_points
+from .users import get_user
+
+logger = logging.getLogger(__name__)
+
+MIN_SCORE, MAX_SCORE = 1, 5
+
+
+def add_rating(session, model, target_id, score):
+    """Adds one score to the running sum and count of a user or point.
+
+    SET expressions read the pre-update row, so concurrent reviews
+    never overwrite each other's increments.
+    """
+    session.execute(
+        update(model)
+        .where(model.id == target_id)
+        .values(
+            rating_sum=model.rating_sum + score,
+            rating_count=model.rating_count + 1,
+            rating=(model.rating_sum + score) * 1.0
+            / (model.rating_count + 1),
+        )
+    )
+
+
+def write_review(session, shift_id, author_id, score):
+    """Stores a review and updates the reviewed rating in one commit.
+
+    Returns (model, reviewed id, point owner id, new rating) on
+    success, otherwise one of 'missing', 'not_completed', 'forbidden'
+    or 'duplicate'.
+    """
+    # Old shifts may already have moved to the archive.
+    for shift in (Shift, ArchivedShift):
+        row = (
+            session.query(shift.worker_id, shift.date, Point.id,
+                          Point.owner_id)
+            .join(Point, Point.id == shift.point_id)
+            .filter(shift.id == shift_id)
+            .first()
+        )
+        if row is not None:
+            break
+    else:
+        return 'missing'
+    worker_id, date, point_id, owner_id = row
+    if worker_id is None or date > datetime.date.today():
+        return 'not_completed'
+    if author_id == worker_id:
+        model, target_id = Point, point_id
+        review = Review(shift_id=shift_id, author_id=author_id,
+                        point_id=point_id, score=score)
+    elif author_id == owner_id:
+        model, target_id = User, worker_id
+        review = Review(shift_id=shift_id, author_id=author_id,
+                        user_id=worker_id, score=score)
+    else:
+        return 'forbidden'
+    try:
+        session.add(review)
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        return 'duplicate'
+    add_rating(session, model, target_id, score)
+    session.commit()
+    rating = session.query(model.rating).filter_by(id=target_id).scalar()
+    return model, target_id, owner_id, rating
+
+
+async def review(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        shift_id, score = int(context.args[0]), int(context.args[1])
+        if not MIN_SCORE <= score <= MAX_SCORE:
+            raise ValueError('score out of range')
+    except (IndexError, ValueError):
+        await update.message.reply_text(
+            f'Формат: /review <id смены> <оценка {MIN_SCORE}-{MAX_SCORE}>'
+        )
+        return
+    try:
+        user = await get_user(update.message.from_user.id)
+        if not user:
+            await update.message.reply_text('Сначала зарегистрируйтесь:'
+                                            ' /register')
+            return
+        result = await run_in_session(write_review, shift_id, user[0],
+                                      score)
+        if isinstance(result, str):
+            await update.message.reply_text({
+                'missing': 'Указанная смена не найдена.',
+                'not_completed': 'Оценить можно только состоявшуюся'
+                                 ' смену.',
+                'forbidden': 'Оценить смену могут только ее соискатель'
+                             ' и владелец пункта выдачи.',
+                'duplicate': 'Вы уже оценили эту смену.',
+            }[result])
+            return
+        model, target_id, owner_id, rating = result
+        if model is Point:
+            invalidate_points(owner_id)
+            target = f'пункта выдачи {target_id}'
+        else:
+            target = 'соискателя'
+        await update.message.reply_text(
+            f'Спасибо за отзыв! Рейтинг {target}: {rating:.2f}.'
+        )
+    except Exception:
+        logger.exception('Failed to handle update')
+        await update.message.reply_text('Некорректный запрос на'
+                                        ' оценку смены.')
+
+
+review_handler = CommandHandler('review', review)
@@ -0,0 +1,95 @@
+import re
+import logging
+
+from sqlalchemy import func, text
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup,
+    InlineQueryResultArticle, InputTextMessageContent,
+)
+from telegram.constants import ChatType
+from telegram.ext import ContextTypes, InlineQueryHandler
+
+from models import Point, run_in_session
+from .users import get_user
+
+logger = logging.getLogger(__name__)
+
+SEARCH_LIMIT = 20
+SEARCH_MAX_WORDS = 8
+SEARCH_CACHE_TIME = 10
+
+# points_fts and its triggers are created by migrations.py. CROSS JOIN
+# keeps the full-text match as the outer loop even with an owner, and
+# rowid order lets it stop at the limit instead of ranking every match.
+SQLITE_SEARCH = text('''
+    SELECT points.id, points.name, points.address
+    FROM points_fts CROSS JOIN points ON points.id = points_fts.rowid
+    WHERE points_fts MATCH :match
+      AND (:owner_id IS NULL OR points.owner_id = :owner_id)
+    ORDER BY points_fts.rowid
+    LIMIT :limit
+''')
+
+
+def search_words(query):
+    return re.findall(r'\w+', query.lower().replace('ё', 'е'))[
+        :SEARCH_MAX_WORDS]
+
+
+def search_points(session, query, owner_id=None, limit=SEARCH_LIMIT):
+    """Finds points by the words of their name and address.
+
+    Every word of the query has to match, as a word prefix on SQLite
+    and as a substring on PostgreSQL. Results come in id order.
+    """
+    words = search_words(query)
+    if not words:
+        return []
+    if session.get_bind().dialect.name == 'sqlite':
+        match = ' '.join(f'"{word}"*' for word in words)
+        return [tuple(row) for row in session.execute(SQLITE_SEARCH, {
+            'match': match, 'owner_id': owner_id, 'limit': limit,
+        })]
+    # PostgreSQL: substring match served by the pg_trgm index.
+    searchable = (func.coalesce(Point.name, '') + ' '
+                  + func.coalesce(Point.address, ''))
+    rows = session.query(Point.id, Point.name, Point.address).filter(
+        *(searchable.ilike(f'%{word}%') for word in words))
+    if owner_id is not None:
+        rows = rows.filter(Point.owner_id == owner_id)
+    return [tuple(row) for row in rows.order_by(Point.id).limit(limit)]
+
+
+def search_keyboard():
+    return InlineKeyboardMarkup([[InlineKeyboardButton(
+        'Найти по названию или адресу',
+        switch_inline_query_current_chat='',
+    )]])
+
+
+async def search_points_inline(update: Update,
+                               context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.inline_query
+    try:
+        user = await get_user(query.from_user.id)
+        # Owners pick among their own points, everybody else among all.
+        owner_id = user[0] if user and user[1] == 'reg_owner' else None
+        rows = await run_in_session(search_points, query.query, owner_id)
+        # In the chat with the bot the chosen id answers its question.
+        in_bot_chat = query.chat_type == ChatType.SENDER
+        await query.answer([
+            InlineQueryResultArticle(
+                id=str(point_id),
+                title=name,
+                description=f'{address} (id {point_id})',
+                input_message_content=InputTextMessageContent(
+                    str(point_id) if in_bot_chat
+                    else f'Пункт выдачи {point_id}: {name}, {address}'),
+            )
+            for point_id, name, address in rows
+        ], cache_time=SEARCH_CACHE_TIME, is_personal=True)
+    except Exception:
+        logger.exception('Failed to handle update')
+
+
+point_search_handler = InlineQueryHandler(search_points_inline)
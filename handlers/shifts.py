@@ -1,22 +1,49 @@
-import traceback
+import datetime
 import logging
-import prettytable
 
-from telegram import Update, ReplyKeyboardRemove
+from sqlalchemy import and_, insert, or_
+from sqlalchemy.exc import IntegrityError
+from telegram import (
+    Update, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup,
+)
 from telegram.ext import (
     ContextTypes, CommandHandler, ConversationHandler,
     MessageHandler, filters, CallbackQueryHandler
 )
 from telegram.constants import ParseMode
-from telegram_bot_calendar import DetailedTelegramCalendar
 
-from models import User, Shift, Point, Session
+from cache import TTLCache, replicated
+from models import (
+    NewShift, Notification, Point, Shift, ShiftReminder, dialect_insert,
+    run_in_session,
+)
+from reminders import cancel_reminder, schedule_reminder
+from shift_stats import count_shifts
+from .date_picker import CALENDAR_PATTERN, ShiftDatePicker
+from .search import search_keyboard
+from .users import get_user
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 POINT_ID, DATE, SHIFT_ID, NEW_DATE = range(4)
 
+SCHEDULE_PAGE_SIZE = 20
+OPEN_SHIFTS_PAGE_SIZE = 10
+PAGE_CACHE_SIZE = 1000
+PAGE_CACHE_TTL = 600
+
+page_cache = TTLCache(PAGE_CACHE_SIZE, PAGE_CACHE_TTL)
+
+CALLBACK_CACHE_SIZE = 10000
+CALLBACK_CACHE_TTL = 600
+
+handled_callbacks = TTLCache(CALLBACK_CACHE_SIZE, CALLBACK_CACHE_TTL)
+
+BULK_SHIFT_MAX_DAYS = 366
+WEEKDAYS = ['пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс']
+
+date_picker = ShiftDatePicker(locale='ru')
+
 ru_LSTEP = {
     'y': 'год',
     'm': 'месяц',
@@ -24,94 +51,564 @@ ru_LSTEP = {
 }
 
 
+def fetch_shifts_page(session, point_id, date_from, date_to,
+                      cursor=None, backward=False):
+    query = session.query(Shift.id, Shift.point_id, Shift.date)
+    if point_id is not None:
+        query = query.filter(Shift.point_id == point_id)
+    if date_from:
+        query = query.filter(Shift.date >= date_from)
+    if date_to:
+        query = query.filter(Shift.date <= date_to)
+    if cursor:
+        date, shift_id = cursor
+        if backward:
+            query = query.filter(or_(
+                Shift.date < date,
+                and_(Shift.date == date, Shift.id < shift_id),
+            ))
+        else:
+            query = query.filter(or_(
+                Shift.date > date,
+                and_(Shift.date == date, Shift.id > shift_id),
+            ))
+    if backward:
+        query = query.order_by(Shift.date.desc(), Shift.id.desc())
+    else:
+        query = query.order_by(Shift.date, Shift.id)
+    rows = [tuple(row) for row in query.limit(SCHEDULE_PAGE_SIZE + 1)]
+    more = len(rows) > SCHEDULE_PAGE_SIZE
+    rows = rows[:SCHEDULE_PAGE_SIZE]
+    if backward:
+        rows.reverse()
+    return rows, more
+
+
+def parse_schedule_args(args):
+    point_id, dates = None, []
+    for arg in args:
+        if arg.isdigit():
+            point_id = int(arg)
+        else:
+            dates.append(datetime.date.fromisoformat(arg))
+    if len(dates) > 2:
+        raise ValueError('too many dates')
+    dates += [None] * (2 - len(dates))
+    return point_id, dates[0], dates[1]
+
+
+def encode_schedule_filters(point_id, date_from, date_to):
+    return ':'.join([
+        str(point_id) if point_id is not None else '',
+        date_from.strftime('%Y%m%d') if date_from else '',
+        date_to.strftime('%Y%m%d') if date_to else '',
+    ])
+
+
+def decode_date(value):
+    if not value:
+        return None
+    return datetime.datetime.strptime(value, '%Y%m%d').date()
+
+
+def schedule_keyboard(rows, filters_data, has_prev, has_next):
+    buttons = []
+    if has_prev:
+        shift_id, _, date = rows[0]
+        buttons.append(InlineKeyboardButton(
+            '« Назад',
+            callback_data=f'sched:p:{filters_data}:'
+                          f'{date.strftime("%Y%m%d")}:{shift_id}',
+        ))
+    if has_next:
+        shift_id, _, date = rows[-1]
+        buttons.append(InlineKeyboardButton(
+            'Вперед »',
+            callback_data=f'sched:n:{filters_data}:'
+                          f'{date.strftime("%Y%m%d")}:{shift_id}',
+        ))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+def render_schedule(rows):
+    import prettytable
+
+    table = prettytable.PrettyTable(['id', 'point_id', 'date'])
+    for row in rows:
+        table.add_row(row)
+    return f'```{table}```'
+
+
+def fetch_open_shifts(session, point_id, cursor):
+    query = (
+        session.query(Shift.id, Shift.date, Point.name, Point.address)
+        .join(Point, Point.id == Shift.point_id)
+        .filter(Shift.worker_id.is_(None))
+    )
+    if point_id is not None:
+        query = query.filter(Shift.point_id == point_id)
+    date, shift_id = cursor
+    query = query.filter(Shift.date >= date, or_(
+        Shift.date > date,
+        and_(Shift.date == date, Shift.id > shift_id),
+    ))
+    rows = [
+        tuple(row) for row in query.order_by(Shift.date, Shift.id)
+        .limit(OPEN_SHIFTS_PAGE_SIZE + 1)
+    ]
+    return rows[:OPEN_SHIFTS_PAGE_SIZE], len(rows) > OPEN_SHIFTS_PAGE_SIZE
+
+
+def render_open_shifts(title, rows):
+    return '\n'.join([title] + [
+        f'{date:%d.%m.%Y} — {name}, {address} (смена {shift_id})'
+        for shift_id, date, name, address in rows
+    ])
+
+
+def claim_keyboard(rows, next_data=None):
+    buttons = [
+        [InlineKeyboardButton(f'Взять смену {shift_id} ({date:%d.%m})',
+                              callback_data=f'claim:{shift_id}')]
+        for shift_id, date, *_ in rows
+    ]
+    if next_data:
+        buttons.append([InlineKeyboardButton('Вперед »',
+                                             callback_data=next_data)])
+    return InlineKeyboardMarkup(buttons)
+
+
+def claim_shift(session, shift_id, worker_id):
+    """Assigns an open shift to the worker in one conditional UPDATE.
+
+    Two workers claiming the same shift race on the database row, not
+    on anything held in the bot, and exactly one UPDATE matches.
+    Returns 'claimed', 'own', 'taken', 'past' or 'missing'.
+    """
+    claimed = session.query(Shift).filter(
+        Shift.id == shift_id,
+        Shift.worker_id.is_(None),
+        Shift.date >= datetime.date.today(),
+    ).update({Shift.worker_id: worker_id}, synchronize_session=False)
+    if claimed:
+        point_id, date = session.query(Shift.point_id, Shift.date).filter(
+            Shift.id == shift_id).one()
+        count_shifts(session, [(point_id, date, 0, 1)])
+    session.commit()
+    if claimed:
+        return 'claimed'
+    owner = session.query(Shift.worker_id).filter_by(id=shift_id).first()
+    if owner is None:
+        return 'missing'
+    if owner[0] is None:
+        # Still open, so only the date filter can have failed.
+        return 'past'
+    return 'own' if owner[0] == worker_id else 'taken'
+
+
+def first_delivery(query):
+    """Returns False for a callback query handled in the last minutes.
+
+    Telegram delivers a callback query again when the answer is late;
+    the repeat is dropped before it reaches the database.
+    """
+    if handled_callbacks.get(query.id):
+        return False
+    handled_callbacks.set(query.id, True)
+    return True
+
+
+def point_exists(session, point_id):
+    return session.query(Point.id).filter_by(id=point_id).first() is not None
+
+
+def shift_exists(session, shift_id):
+    return session.query(Shift.id).filter_by(id=shift_id).first() is not None
+
+
+def insert_new_shifts(session, rows):
+    """Inserts the shifts whose (point_id, date) is not taken yet.
+
+    The unique index decides, so concurrent or repeated inserts of the
+    same day store one shift. Returns (id, point_id, date) of the new
+    ones; the caller commits.
+    """
+    if not rows:
+        return []
+    created = session.execute(
+        dialect_insert(session, Shift)
+        .on_conflict_do_nothing(index_elements=[Shift.point_id, Shift.date])
+        .returning(Shift.id, Shift.point_id, Shift.date),
+        rows,
+    ).all()
+    if created:
+        session.execute(insert(NewShift), [{'shift_id': shift_id}
+                                           for shift_id, _, _ in created])
+    count_shifts(session, [(point_id, date, 1, 0)
+                           for _, point_id, date in created])
+    return created
+
+
+def insert_shift(session, point_id, date):
+    """Returns the new shift's id, or None if the day already has one."""
+    created = insert_new_shifts(session, [{'point_id': point_id,
+                                           'date': date}])
+    session.commit()
+    return created[0][0] if created else None
+
+
+def insert_shifts(session, point_id, dates):
+    if not point_exists(session, point_id):
+        return None
+    created = insert_new_shifts(session, [
+        {'point_id': point_id, 'date': date} for date in dates
+    ])
+    session.commit()
+    return sorted(date for _, _, date in created)
+
+
+def parse_weekdays(value):
+    weekdays = set()
+    for part in value.lower().split(','):
+        if '-' in part:
+            first, last = (WEEKDAYS.index(day) for day in part.split('-'))
+            weekdays.add(first)
+            while first != last:
+                first = (first + 1) % 7
+                weekdays.add(first)
+        else:
+            weekdays.add(WEEKDAYS.index(part))
+    return weekdays
+
+
+def shift_dates(date_from, date_to, weekdays):
+    days = (date_to - date_from).days + 1
+    if days < 1 or days > BULK_SHIFT_MAX_DAYS:
+        raise ValueError('invalid date range')
+    return [
+        date for date in (date_from + datetime.timedelta(days=offset)
+                          for offset in range(days))
+        if date.weekday() in weekdays
+    ]
+
+
+def update_shift_date(session, shift_id, date):
+    """Returns (point_id, old date), or None if the day is taken."""
+    shift = session.query(Shift).filter_by(id=shift_id).first()
+    point_id, old_date = shift.point_id, shift.date
+    shift.date = date
+    filled = int(shift.worker_id is not None)
+    try:
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        return None
+    count_shifts(session, [(point_id, old_date, -1, -filled),
+                           (point_id, date, 1, filled)])
+    session.commit()
+    return point_id, old_date
+
+
+def remove_shift(session, shift_id):
+    shift = session.query(Shift).filter_by(id=shift_id).first()
+    if not shift:
+        return None
+    point_id, date = shift.point_id, shift.date
+    count_shifts(session, [(point_id, date, -1,
+                            -int(shift.worker_id is not None))])
+    # Foreign keys are not enforced on SQLite, so no cascade either.
+    for model in (Notification, NewShift, ShiftReminder):
+        session.query(model).filter_by(shift_id=shift_id).delete()
+    session.delete(shift)
+    session.commit()
+    return point_id, date
+
+
+async def load_schedule_page(point_id, date_from, date_to,
+                             cursor=None, backward=False):
+    key = (point_id, date_from, date_to, cursor, backward)
+    page = page_cache.get(key)
+    if page is None:
+        rows, more = await run_in_session(
+            fetch_shifts_page, point_id, date_from, date_to, cursor, backward)
+        if rows:
+            if backward:
+                has_prev, has_next = more, True
+            else:
+                has_prev, has_next = cursor is not None, more
+            filters_data = encode_schedule_filters(point_id, date_from,
+                                                   date_to)
+            page = (render_schedule(rows),
+                    schedule_keyboard(rows, filters_data, has_prev, has_next))
+        else:
+            page = (None, None)
+        page_cache.set(key, page)
+    return page
+
+
+@replicated
+def invalidate_schedule(point_id, *dates):
+    def affected(key):
+        key_point_id, date_from, date_to = key[:3]
+        if key_point_id is not None and key_point_id != point_id:
+            return False
+        return any(
+            (date_from is None or date_from <= date)
+            and (date_to is None or date <= date_to)
+            for date in dates
+        )
+    page_cache.invalidate_where(affected)
+
+
+@replicated
+def invalidate_point_schedules(point_id):
+    # Pages of this point and of all points, whatever their dates.
+    page_cache.invalidate_where(
+        lambda key: key[0] is None or key[0] == point_id)
+
+
+@replicated
+def invalidate_all_schedules():
+    page_cache.clear()
+
+
 async def schedule(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    session = Session()
     try:
-        shifts = session.query(Shift).all()
-        if shifts:
-            table = prettytable.PrettyTable(['id', 'point_id', 'date'])
-            for shift in shifts:
-                table.add_row([
-                    shift.id,
-                    shift.point_id,
-                    shift.date,
-                ])
+        point_id, date_from, date_to = parse_schedule_args(context.args)
+    except ValueError:
+        await update.message.reply_text(
+            'Формат: /schedule [id пункта] [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД]'
+        )
+        return
+    try:
+        text, keyboard = await load_schedule_page(point_id, date_from,
+                                                  date_to)
+        if text:
             await update.message.reply_text(
-                f'```{table}```',
-                parse_mode=ParseMode.MARKDOWN_V2
+                text,
+                parse_mode=ParseMode.MARKDOWN_V2,
+                reply_markup=keyboard,
             )
         else:
             await update.message.reply_text('Смен нет.')
     except Exception:
-        logger.error(traceback.format_exc())
+        logger.exception('Failed to handle update')
         await update.message.reply_text('Некорректный запрос на'
                                         ' просмотр смен.')
-    finally:
-        session.close()
+
+
+async def schedule_page(update: Update,
+                        context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    try:
+        _, direction, point_id, date_from, date_to, date, shift_id = (
+            query.data.split(':'))
+        text, keyboard = await load_schedule_page(
+            int(point_id) if point_id else None,
+            decode_date(date_from), decode_date(date_to),
+            (decode_date(date), int(shift_id)), direction == 'p')
+        if text:
+            await query.message.edit_text(
+                text,
+                parse_mode=ParseMode.MARKDOWN_V2,
+                reply_markup=keyboard,
+            )
+        else:
+            await query.message.edit_text('Смен нет.')
+    except Exception:
+        logger.exception('Failed to handle update')
+        await query.message.edit_text('Некорректный запрос на'
+                                      ' просмотр смен.')
+
+
+async def send_open_shifts(message, point_id, cursor, edit=False):
+    rows, more = await run_in_session(fetch_open_shifts, point_id, cursor)
+    if not rows:
+        text, keyboard = 'Свободных смен нет.', None
+    else:
+        next_data = None
+        if more:
+            shift_id, date = rows[-1][:2]
+            next_data = (f'open:{point_id if point_id is not None else ""}'
+                         f':{date.strftime("%Y%m%d")}:{shift_id}')
+        text = render_open_shifts('Свободные смены:', rows)
+        keyboard = claim_keyboard(rows, next_data)
+    if edit:
+        await message.edit_text(text, reply_markup=keyboard)
+    else:
+        await message.reply_text(text, reply_markup=keyboard)
+
+
+async def open_shifts(update: Update,
+                      context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        point_id, date_from, _ = parse_schedule_args(context.args)
+    except ValueError:
+        await update.message.reply_text(
+            'Формат: /openshifts [id пункта] [с ГГГГ-ММ-ДД]'
+        )
+        return
+    try:
+        date_from = max(date_from or datetime.date.today(),
+                        datetime.date.today())
+        await send_open_shifts(update.message, point_id, (date_from, 0))
+    except Exception:
+        logger.exception('Failed to handle update')
+        await update.message.reply_text('Некорректный запрос на'
+                                        ' просмотр свободных смен.')
+
+
+async def open_shifts_page(update: Update,
+                           context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    try:
+        _, point_id, date, shift_id = query.data.split(':')
+        await send_open_shifts(
+            query.message, int(point_id) if point_id else None,
+            (decode_date(date), int(shift_id)), edit=True)
+    except Exception:
+        logger.exception('Failed to handle update')
+        await query.message.edit_text('Некорректный запрос на'
+                                      ' просмотр свободных смен.')
+
+
+async def claim_shift_button(update: Update,
+                             context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    try:
+        user = await get_user(query.from_user.id)
+        if not user or user[1] != 'reg_worker':
+            await query.answer('Брать смены могут только соискатели.',
+                               show_alert=True)
+            return
+        shift_id = int(query.data.split(':')[1])
+        result = await run_in_session(claim_shift, shift_id, user[0])
+        await query.answer({
+            'claimed': f'Смена {shift_id} ваша.',
+            'own': f'Смена {shift_id} уже ваша.',
+            'taken': f'Смену {shift_id} уже взял другой соискатель.',
+            'past': f'Смена {shift_id} уже прошла.',
+            'missing': f'Смена {shift_id} не найдена.',
+        }[result], show_alert=True)
+        markup = query.message.reply_markup
+        if markup:
+            await query.message.edit_reply_markup(InlineKeyboardMarkup([
+                row for row in markup.inline_keyboard
+                if row[0].callback_data != query.data
+            ]))
+    except Exception:
+        logger.exception('Failed to handle update')
+        await query.answer('Некорректный запрос на взятие смены.')
 
 
 async def add_shift_start(update: Update,
                           context: ContextTypes.DEFAULT_TYPE) -> int:
-    await update.message.reply_text('Укажите id пункта выдачи:')
+    await update.message.reply_text('Укажите id пункта выдачи:',
+                                    reply_markup=search_keyboard())
     return POINT_ID
 
 
 async def add_shift_point_id(update: Update,
                              context: ContextTypes.DEFAULT_TYPE) -> int:
     point_id = int(update.message.text)
-    session = Session()
     try:
-        point = session.query(Point).filter_by(id=point_id).first()
-        if not point:
+        if not await run_in_session(point_exists, point_id):
             await update.message.reply_text('Указанный пункт выдачи'
                                             ' не найден.')
             return ConversationHandler.END
 
         context.user_data['point_id'] = point_id
-        calendar, step = DetailedTelegramCalendar(locale='ru').build()
+        calendar, step = date_picker.build()
         await update.message.reply_text('Выберите дату смены:',
                                         reply_markup=calendar)
         return DATE
     except Exception:
-        logger.error(traceback.format_exc())
+        logger.exception('Failed to handle update')
         await update.message.reply_text('Некорректный запрос на'
                                         ' добавление смены.')
-    finally:
-        session.close()
 
 
 async def add_shift_date(update: Update,
                          context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
+    if not first_delivery(query):
+        return None
     await query.answer()
-    result, key, step = DetailedTelegramCalendar(
-        locale='ru').process(query.data)
+    result, key, step = date_picker.process(query.data)
     if not result and key:
         await query.message.edit_text(f'Выберите {ru_LSTEP[step]}:',
                                       reply_markup=key)
     elif result:
         context.user_data['date'] = result
-        session = Session()
         try:
-            user = session.query(User).filter_by(
-                telegram_id=query.from_user.id).first()
-            if user and user.role == 'reg_owner':
-                shift = Shift(point_id=context.user_data['point_id'],
-                              date=context.user_data['date'],)
-                session.add(shift)
-                session.commit()
+            user = await get_user(query.from_user.id)
+            if user and user[1] == 'reg_owner':
+                shift_id = await run_in_session(
+                    insert_shift, context.user_data['point_id'],
+                    context.user_data['date'])
+                if shift_id is None:
+                    await query.message.edit_text('На эту дату у пункта'
+                                                  ' уже есть смена.')
+                    return ConversationHandler.END
+                invalidate_schedule(context.user_data['point_id'],
+                                    context.user_data['date'])
+                schedule_reminder(shift_id, context.user_data['date'])
                 await query.message.edit_text('Смена добавлена.')
             else:
                 await query.message.edit_text('Нет прав на добавление смены.')
         except Exception:
-            logger.error(traceback.format_exc())
+            logger.exception('Failed to handle update')
             await query.message.edit_text('Некорректный запрос на'
                                           ' добавление смены.')
-        finally:
-            session.close()
         return ConversationHandler.END
 
 
+async def add_shifts(update: Update,
+                     context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        point_id = int(context.args[0])
+        date_from = datetime.date.fromisoformat(context.args[1])
+        date_to = datetime.date.fromisoformat(context.args[2])
+        if len(context.args) > 3:
+            weekdays = parse_weekdays(context.args[3])
+        else:
+            weekdays = set(range(7))
+        dates = shift_dates(date_from, date_to, weekdays)
+    except (IndexError, ValueError):
+        await update.message.reply_text(
+            'Формат: /addshifts <id пункта> <с ГГГГ-ММ-ДД> <по ГГГГ-ММ-ДД>'
+            ' [дни недели, например пн-пт или пн,ср,пт]'
+        )
+        return
+    try:
+        user = await get_user(update.message.from_user.id)
+        if not user or user[1] != 'reg_owner':
+            await update.message.reply_text('Нет прав на добавление смен.')
+            return
+        if not dates:
+            await update.message.reply_text('В указанном периоде нет'
+                                            ' подходящих дней.')
+            return
+
+        created = await run_in_session(insert_shifts, point_id, dates)
+        if created is None:
+            await update.message.reply_text('Указанный пункт выдачи'
+                                            ' не найден.')
+            return
+        if created:
+            invalidate_schedule(point_id, *created)
+        await update.message.reply_text(
+            f'Добавлено смен: {len(created)}. '
+            f'Пропущено (смена уже есть): {len(dates) - len(created)}.'
+        )
+    except Exception:
+        logger.exception('Failed to handle update')
+        await update.message.reply_text('Некорректный запрос на'
+                                        ' добавление смен.')
+
+
 async def edit_shift_start(update: Update,
                            context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text('Укажите ID смены:')
@@ -121,56 +618,56 @@ async def edit_shift_start(update: Update,
 async def edit_shift_id(update: Update,
                         context: ContextTypes.DEFAULT_TYPE) -> int:
     shift_id = int(update.message.text)
-    session = Session()
     try:
-        shift = session.query(Shift).filter_by(id=shift_id).first()
-        if not shift:
+        if not await run_in_session(shift_exists, shift_id):
             await update.message.reply_text('Указанная смена не найдена.')
             return ConversationHandler.END
 
         context.user_data['shift_id'] = shift_id
-        calendar, step = DetailedTelegramCalendar(locale='ru').build()
+        calendar, step = date_picker.build()
         await update.message.reply_text('Выберите новую дату смены:',
                                         reply_markup=calendar)
         return NEW_DATE
     except Exception:
-        logger.error(traceback.format_exc())
+        logger.exception('Failed to handle update')
         await update.message.reply_text('Некорректный запрос на'
                                         ' изменение смены.')
-    finally:
-        session.close()
 
 
 async def edit_shift_date(update: Update,
                           context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
+    if not first_delivery(query):
+        return None
     await query.answer()
-    result, key, step = DetailedTelegramCalendar(
-        locale='ru').process(query.data)
+    result, key, step = date_picker.process(query.data)
     if not result and key:
         await query.message.edit_text(f'Выберите {ru_LSTEP[step]}:',
                                       reply_markup=key)
     elif result:
         context.user_data['date'] = result
-        session = Session()
         try:
-            user = session.query(User).filter_by(
-                telegram_id=query.from_user.id).first()
-            if user and user.role == 'reg_owner':
-                shift = session.query(Shift).filter_by(
-                    id=context.user_data['shift_id']).first()
-                shift.date = context.user_data['date']
-                session.add(shift)
-                session.commit()
+            user = await get_user(query.from_user.id)
+            if user and user[1] == 'reg_owner':
+                moved = await run_in_session(
+                    update_shift_date, context.user_data['shift_id'],
+                    context.user_data['date'])
+                if moved is None:
+                    await query.message.edit_text('На эту дату у пункта'
+                                                  ' уже есть смена.')
+                    return ConversationHandler.END
+                point_id, old_date = moved
+                invalidate_schedule(point_id, old_date,
+                                    context.user_data['date'])
+                schedule_reminder(context.user_data['shift_id'],
+                                  context.user_data['date'])
                 await query.message.edit_text('Смена изменена.')
             else:
                 await query.message.edit_text('Нет прав на изменение смены.')
         except Exception:
-            logger.error(traceback.format_exc())
+            logger.exception('Failed to handle update')
             await query.message.edit_text('Некорректный запрос на'
                                           ' изменение смены.')
-        finally:
-            session.close()
         return ConversationHandler.END
 
 
@@ -183,18 +680,17 @@ async def delete_shift_start(update: Update,
 async def delete_shift_id(update: Update,
                           context: ContextTypes.DEFAULT_TYPE) -> int:
     shift_id = int(update.message.text)
-    session = Session()
     try:
-        shift = session.query(Shift).filter_by(id=shift_id).first()
-        if not shift:
+        if not await run_in_session(shift_exists, shift_id):
             await update.message.reply_text('Указанная смена не найдена.')
             return ConversationHandler.END
 
-        telegram_id = update.message.from_user.id
-        user = session.query(User).filter_by(telegram_id=telegram_id).first()
-        if user and user.role == 'reg_owner':
-            session.delete(shift)
-            session.commit()
+        user = await get_user(update.message.from_user.id)
+        if user and user[1] == 'reg_owner':
+            removed = await run_in_session(remove_shift, shift_id)
+            if removed:
+                invalidate_schedule(*removed)
+                cancel_reminder(shift_id)
             await update.message.reply_text(
                 f'Смена "{shift_id}" удалена.',
                 reply_markup=ReplyKeyboardRemove(),
@@ -203,11 +699,10 @@ async def delete_shift_id(update: Update,
             await update.message.edit_text('Нет прав на удаление смены.')
             return ConversationHandler.END
     except Exception:
-        logger.error(traceback.format_exc())
+        logger.exception('Failed to handle update')
         await update.message.reply_text('Некорректный запрос на'
                                         ' изменение смены.')
     finally:
-        session.close()
         return ConversationHandler.END
 
 
@@ -218,15 +713,25 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 
 schedule_handler = CommandHandler('schedule', schedule)
+schedule_page_handler = CallbackQueryHandler(schedule_page,
+                                             pattern=r'^sched:')
+add_shifts_handler = CommandHandler('addshifts', add_shifts)
+open_shifts_handler = CommandHandler('openshifts', open_shifts)
+open_shifts_page_handler = CallbackQueryHandler(open_shifts_page,
+                                                pattern=r'^open:')
+claim_shift_handler = CallbackQueryHandler(claim_shift_button,
+                                           pattern=r'^claim:')
 add_shift_conv_handler = ConversationHandler(
     entry_points=[CommandHandler('addshift', add_shift_start)],
     states={
         POINT_ID: [MessageHandler(
             filters.TEXT & ~filters.COMMAND, add_shift_point_id)],
         DATE: [CallbackQueryHandler(
-            add_shift_date, pattern=DetailedTelegramCalendar.func)],
+            add_shift_date, pattern=CALENDAR_PATTERN)],
     },
     fallbacks=[CommandHandler('cancel', cancel)],
+    name='add_shift',
+    persistent=True,
 )
 edit_shift_conv_handler = ConversationHandler(
     entry_points=[CommandHandler('editshift', edit_shift_start)],
@@ -234,9 +739,11 @@ edit_shift_conv_handler = ConversationHandler(
         SHIFT_ID: [MessageHandler(
             filters.TEXT & ~filters.COMMAND, edit_shift_id)],
         NEW_DATE: [CallbackQueryHandler(
-            edit_shift_date, pattern=DetailedTelegramCalendar.func)],
+            edit_shift_date, pattern=CALENDAR_PATTERN)],
     },
     fallbacks=[CommandHandler('cancel', cancel)],
+    name='edit_shift',
+    persistent=True,
 )
 delete_shift_conv_handler = ConversationHandler(
     entry_points=[CommandHandler('deleteshift', delete_shift_start)],
@@ -245,4 +752,6 @@ delete_shift_conv_handler = ConversationHandler(
             filters.TEXT & ~filters.COMMAND, delete_shift_id)],
     },
     fallbacks=[CommandHandler('cancel', cancel)],
+    name='delete_shift',
+    persistent=True,
 )
@@ -0,0 +1,86 @@
+import datetime
+import logging
+
+from telegram import Update
+from telegram.ext import ContextTypes, CommandHandler
+from telegram.constants import ParseMode
+
+from models import Point, ShiftStats, run_in_session
+from .users import get_user
+
+logger = logging.getLogger(__name__)
+
+STATS_MONTHS = 6
+STATS_MAX_ROWS = 50
+
+
+def first_month(today, months):
+    """Returns the first day of the month months - 1 before today's."""
+    index = today.year * 12 + today.month - months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def fetch_stats(session, owner_id, point_id, since):
+    query = (
+        session.query(ShiftStats.point_id, Point.name, ShiftStats.month,
+                      ShiftStats.total, ShiftStats.filled)
+        .join(Point, Point.id == ShiftStats.point_id)
+        .filter(
+            Point.owner_id == owner_id,
+            ShiftStats.month >= since,
+            ShiftStats.total > 0,
+        )
+    )
+    if point_id is not None:
+        query = query.filter(ShiftStats.point_id == point_id)
+    rows = (
+        query.order_by(ShiftStats.point_id, ShiftStats.month)
+        .limit(STATS_MAX_ROWS + 1)
+        .all()
+    )
+    return rows[:STATS_MAX_ROWS], len(rows) > STATS_MAX_ROWS
+
+
+def render_stats(rows):
+    import prettytable
+
+    table = prettytable.PrettyTable(['id', 'name', 'month', 'total',
+                                     'filled', 'open'])
+    for point_id, name, month, total, filled in rows:
+        table.add_row([point_id, name, f'{month:%Y-%m}', total, filled,
+                       total - filled])
+    return f'```{table}```'
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        point_id = int(context.args[0]) if context.args else None
+    except ValueError:
+        await update.message.reply_text('Формат: /stats [id пункта]')
+        return
+    try:
+        user = await get_user(update.message.from_user.id)
+        if not user or user[1] != 'reg_owner':
+            await update.message.reply_text('У вас нет доступа к'
+                                            ' статистике смен.')
+            return
+        since = first_month(datetime.date.today(), STATS_MONTHS)
+        rows, more = await run_in_session(fetch_stats, user[0], point_id,
+                                          since)
+        if not rows:
+            await update.message.reply_text('Смен нет.')
+            return
+        await update.message.reply_text(render_stats(rows),
+                                        parse_mode=ParseMode.MARKDOWN_V2)
+        if more:
+            await update.message.reply_text(
+                f'Показаны первые {STATS_MAX_ROWS} строк. Статистика'
+                ' одного пункта: /stats <id пункта>'
+            )
+    except Exception:
+        logger.exception('Failed to handle update')
+        await update.message.reply_text('Некорректный запрос на'
+                                        ' статистику смен.')
+
+
+stats_handler = CommandHandler('stats', stats)
@@ -0,0 +1,113 @@
+import logging
+
+from telegram import Update
+from telegram.ext import ContextTypes, CommandHandler
+
+from models import Subscription, run_in_session
+from .shifts import point_exists
+from .users import get_user
+
+logger = logging.getLogger(__name__)
+
+
+def parse_subscription(args):
+    text = ' '.join(args).strip()
+    if text.isdigit():
+        return int(text), None
+    return None, text.lower() or None
+
+
+def add_subscription(session, worker_id, point_id, area):
+    if session.query(Subscription.id).filter_by(
+            worker_id=worker_id, point_id=point_id, area=area).first():
+        return False
+    if point_id is not None and not point_exists(session, point_id):
+        return None
+    session.add(Subscription(worker_id=worker_id, point_id=point_id,
+                             area=area))
+    session.commit()
+    return True
+
+
+def list_subscriptions(session, worker_id):
+    return [
+        tuple(row) for row in session.query(
+            Subscription.point_id, Subscription.area)
+        .filter_by(worker_id=worker_id)
+        .order_by(Subscription.id)
+    ]
+
+
+def remove_subscriptions(session, worker_id, point_id, area):
+    query = session.query(Subscription).filter_by(worker_id=worker_id)
+    if point_id is not None or area is not None:
+        query = query.filter_by(point_id=point_id, area=area)
+    removed = query.delete(synchronize_session=False)
+    session.commit()
+    return removed
+
+
+def render_subscriptions(subscriptions):
+    return '\n'.join(
+        f'пункт выдачи {point_id}' if point_id is not None
+        else f'район «{area}»'
+        for point_id, area in subscriptions
+    )
+
+
+async def subscribe(update: Update,
+                    context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        user = await get_user(update.message.from_user.id)
+        if not user or user[1] != 'reg_worker':
+            await update.message.reply_text('Подписка на смены доступна'
+                                            ' только соискателям.')
+            return
+        point_id, area = parse_subscription(context.args)
+        if point_id is None and area is None:
+            subscriptions = await run_in_session(list_subscriptions,
+                                                 user[0])
+            text = 'Формат: /subscribe <id пункта или район>.'
+            if subscriptions:
+                text += ('\nВаши подписки:\n'
+                         + render_subscriptions(subscriptions))
+            await update.message.reply_text(text)
+            return
+
+        added = await run_in_session(add_subscription, user[0],
+                                     point_id, area)
+        if added is None:
+            await update.message.reply_text('Указанный пункт выдачи'
+                                            ' не найден.')
+        elif added:
+            await update.message.reply_text('Подписка оформлена. Новые'
+                                            ' смены будут приходить'
+                                            ' в этот чат.')
+        else:
+            await update.message.reply_text('Вы уже подписаны.')
+    except Exception:
+        logger.exception('Failed to handle update')
+        await update.message.reply_text('Некорректный запрос на'
+                                        ' подписку.')
+
+
+async def unsubscribe(update: Update,
+                      context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        user = await get_user(update.message.from_user.id)
+        if not user or user[1] != 'reg_worker':
+            await update.message.reply_text('Подписка на смены доступна'
+                                            ' только соискателям.')
+            return
+        point_id, area = parse_subscription(context.args)
+        removed = await run_in_session(remove_subscriptions, user[0],
+                                       point_id, area)
+        await update.message.reply_text(f'Удалено подписок: {removed}.')
+    except Exception:
+        logger.exception('Failed to handle update')
+        await update.message.reply_text('Некорректный запрос на'
+                                        ' отмену подписки.')
+
+
+subscribe_handler = CommandHandler('subscribe', subscribe)
+unsubscribe_handler = CommandHandler('unsubscribe', unsubscribe)
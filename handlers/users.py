@@ -1,18 +1,46 @@
-import traceback
 import logging
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
 
-from models import User, Session
+from cache import TTLCache
+from models import User, run_in_session
 
-
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-)
 logger = logging.getLogger(__name__)
 
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 300
+
+# Filled by get_user and by save_user on registration. A user's role and
+# telegram_id never change after that, so entries cannot go stale; code
+# that starts changing them must drop the entry in every worker.
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def find_user(session, telegram_id):
+    user = session.query(User).filter_by(telegram_id=telegram_id).first()
+    if user:
+        return user.id, user.role
+    return None
+
+
+def create_user(session, telegram_id, role):
+    if session.query(User).filter_by(telegram_id=telegram_id).first():
+        return None
+    user = User(telegram_id=telegram_id, role=role)
+    session.add(user)
+    session.commit()
+    return user.id
+
+
+async def get_user(telegram_id: int) -> tuple[int, str] | None:
+    user = user_cache.get(telegram_id)
+    if user is None:
+        user = await run_in_session(find_user, telegram_id)
+        if user:
+            user_cache.set(telegram_id, user)
+    return user
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(
@@ -22,10 +50,23 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         '/addpoint - добавление пункта выдачи\n'
         '/editpoint - редактирование пункта выдачи\n'
         '/deletepoint - удаление пункта выдачи\n'
-        '/schedule - просмотр списка смен\n'
+        '/schedule [id пункта] [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД] -'
+        ' просмотр списка смен\n'
         '/addshift - добавление смены\n'
+        '/addshifts - добавление смен на период\n'
         '/editshift - редактирование смены\n'
         '/deleteshift - удаление смены\n'
+        '/openshifts [id пункта] [с ГГГГ-ММ-ДД] - свободные смены\n'
+        '/stats [id пункта] - число смен по месяцам\n'
+        '/review <id смены> <оценка 1-5> - оценка состоявшейся смены\n'
+        '/subscribe [id пункта или район] - подписка на новые смены\n'
+        '/unsubscribe [id пункта или район] - отмена подписки\n'
+        '/exportpoints - выгрузка пунктов выдачи в CSV\n'
+        '/exportshifts - выгрузка смен в CSV\n'
+        'Для загрузки пунктов выдачи или смен отправьте CSV-файл со'
+        ' столбцами name,address или point_id,date\n'
+        f'Поиск пункта выдачи по названию или адресу: @{context.bot.username}'
+        ' <запрос>\n'
     )
 
 
@@ -50,30 +91,23 @@ async def handle_reg_button(update: Update,
 
 
 async def save_user(update: Update, role: str) -> None:
-    session = Session()
     try:
         telegram_id = update.callback_query.from_user.id
-        user = session.query(User).filter_by(
-            telegram_id=telegram_id
-        ).first()
-        if user:
+        user_id = await run_in_session(create_user, telegram_id, role)
+        if user_id:
+            user_cache.set(telegram_id, (user_id, role))
             await update.callback_query.message.edit_text(
-                'Вы уже зарегистрированы.'
+                'Регистрация прошла успешно.'
             )
         else:
-            user = User(telegram_id=telegram_id, role=role)
-            session.add(user)
-            session.commit()
             await update.callback_query.message.edit_text(
-                'Регистрация прошла успешно.'
+                'Вы уже зарегистрированы.'
             )
     except Exception:
-        logger.error(traceback.format_exc())
+        logger.exception('Failed to handle update')
         await update.message.reply_text(
             'Некорректный запрос на регистрацию пользователя.'
         )
-    finally:
-        session.close()
 
 
 start_handler = CommandHandler('start', start)
@@ -0,0 +1,216 @@
+"""Logging for the bot's entry points.
+
+The root logger only puts records on a bounded queue; a listener thread
+formats them (tracebacks included) and writes them out, so a burst of
+errors does not stall the event loop on formatting or on a slow stream.
+Records logged while an update is handled carry its update id, chat id,
+handler name and the time spent so far.
+"""
+import atexit
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+from typing import Optional
+
+from settings import (
+    LOG_LEVEL, LOG_JSON, LOG_QUEUE_SIZE, LOG_ERROR_SAMPLE_INTERVAL,
+    LOG_DEBUG_SAMPLE_RATE,
+)
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+CONTEXT_FIELDS = ('update_id', 'chat_id', 'handler', 'duration')
+
+log_context = contextvars.ContextVar('log_context', default=None)
+
+
+class LogStats:
+    def __init__(self) -> None:
+        self.queue: Optional[queue.Queue] = None
+        self.dropped = 0
+        self.suppressed = 0
+        self.sampled_out = 0
+
+    def stats(self) -> dict:
+        return {
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            'dropped_total': self.dropped,
+            'suppressed_total': self.suppressed,
+            'sampled_out_total': self.sampled_out,
+        }
+
+
+log_stats = LogStats()
+
+
+def bind_update(update, handler: str) -> contextvars.Token:
+    """Tags records logged from here on with the update being handled.
+
+    Returns the token to pass to log_context.reset().
+    """
+    chat = getattr(update, 'effective_chat', None)
+    return log_context.set({
+        'update_id': getattr(update, 'update_id', None),
+        'chat_id': chat.id if chat is not None else None,
+        'handler': handler,
+        'start': time.perf_counter(),
+    })
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = log_context.get()
+        if context is not None:
+            record.update_id = context['update_id']
+            record.chat_id = context['chat_id']
+            record.handler = context['handler']
+            if not hasattr(record, 'duration'):
+                record.duration = round(
+                    time.perf_counter() - context['start'], 6)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Thins out repeated errors and debug records.
+
+    An error from the same logger, line and exception type as one
+    written less than error_interval seconds ago is dropped, and the
+    next one written carries the number dropped as `suppressed`. Debug
+    records are kept with probability debug_rate.
+    """
+
+    def __init__(self, error_interval: float, debug_rate: float,
+                 stats: LogStats) -> None:
+        super().__init__()
+        self.error_interval = error_interval
+        self.debug_rate = debug_rate
+        self.stats = stats
+        self._lock = threading.Lock()
+        self._errors = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG:
+            if self.debug_rate < 1 and random.random() >= self.debug_rate:
+                self.stats.sampled_out += 1
+                return False
+            return True
+        if record.levelno < logging.ERROR or self.error_interval <= 0:
+            return True
+        key = (record.name, record.lineno,
+               record.exc_info[0] if record.exc_info else None)
+        now = time.monotonic()
+        with self._lock:
+            last = self._errors.get(key)
+            if last is not None and now - last[0] < self.error_interval:
+                last[1] += 1
+                self.stats.suppressed += 1
+                return False
+            if last is not None and last[1]:
+                record.suppressed = last[1]
+            self._errors[key] = [now, 0]
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener without formatting or waiting.
+
+    The message is merged with its arguments here, since they may
+    change later, but tracebacks are left for the listener to format.
+    When the queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, records: queue.Queue, stats: LogStats) -> None:
+        super().__init__(records)
+        self.stats = stats
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.stats.dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        message = super().formatMessage(record)
+        suppressed = getattr(record, 'suppressed', None)
+        if suppressed:
+            message += f' ({suppressed} repeats suppressed)'
+        return message
+
+
+class JsonFormatter(logging.Formatter):
+    """Writes each record as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS + ('suppressed',):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, json_output: bool = LOG_JSON,
+                      stream=None) -> None:
+    """Sets up the root logger and starts the listener thread.
+
+    Entry points call this once; other modules only get their loggers.
+    Calling it again replaces the previous setup.
+    """
+    global _listener, _queue_handler
+    stop_logging()
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter() if json_output
+                        else TextFormatter(LOG_FORMAT))
+    records = queue.Queue(LOG_QUEUE_SIZE)
+    log_stats.queue = records
+    _queue_handler = NonBlockingQueueHandler(records, log_stats)
+    _queue_handler.addFilter(SamplingFilter(
+        LOG_ERROR_SAMPLE_INTERVAL, LOG_DEBUG_SAMPLE_RATE, log_stats))
+    _queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Writes out the queued records and stops the listener thread."""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,290 @@
+import contextvars
+import functools
+import logging
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+from sqlalchemy import event
+from telegram.ext import BaseHandler, ConversationHandler
+from telegram.request import BaseRequest, RequestData
+
+from logging_setup import bind_update, log_context
+from models import engine
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                    5.0, 10.0)
+
+current_stats = contextvars.ContextVar('current_stats', default=None)
+
+
+class UpdateStats:
+    __slots__ = ('db_time', 'queries', 'api_time', 'api_calls', 'errors')
+
+    def __init__(self) -> None:
+        self.db_time = 0.0
+        self.queries = 0
+        self.api_time = 0.0
+        self.api_calls = 0
+        self.errors = 0
+
+
+class HandlerMetrics:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.duration = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.db_time = 0.0
+        self.queries = 0
+        self.api_time = 0.0
+        self.api_calls = 0
+
+    def observe(self, duration: float, stats: UpdateStats) -> None:
+        self.calls += 1
+        self.errors += stats.errors
+        self.duration += duration
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                self.buckets[index] += 1
+        self.db_time += stats.db_time
+        self.queries += stats.queries
+        self.api_time += stats.api_time
+        self.api_calls += stats.api_calls
+
+
+handler_metrics = defaultdict(HandlerMetrics)
+caches = {}
+components = {}
+slow_update_threshold = None
+
+
+def register_cache(name: str, cache) -> None:
+    caches[name] = cache
+
+
+def register_component(name: str, component) -> None:
+    """Exports component.stats() as bot_<name>_<key> metrics.
+
+    Keys ending in _total are counters, everything else is a gauge.
+    """
+    components[name] = component
+
+
+@event.listens_for(engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    stats = current_stats.get()
+    if stats is not None:
+        stats.db_time += elapsed
+        stats.queries += 1
+
+
+class ErrorCounter(logging.Handler):
+    """Counts ERROR records logged while a handler is running.
+
+    Handlers catch their own exceptions and log them, so this is where
+    failures become visible.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(logging.ERROR)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        stats = current_stats.get()
+        if stats is not None:
+            stats.errors += 1
+
+
+class TimedRequest(BaseRequest):
+    """Wraps a BaseRequest and adds Bot API call time to the update stats."""
+
+    def __init__(self, request: BaseRequest) -> None:
+        self._request = request
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self._request.read_timeout
+
+    async def initialize(self) -> None:
+        await self._request.initialize()
+
+    async def shutdown(self) -> None:
+        await self._request.shutdown()
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        *args,
+        **kwargs,
+    ) -> Tuple[int, bytes]:
+        start = time.perf_counter()
+        try:
+            return await self._request.do_request(url, method, request_data,
+                                                  *args, **kwargs)
+        finally:
+            stats = current_stats.get()
+            if stats is not None:
+                stats.api_time += time.perf_counter() - start
+                stats.api_calls += 1
+
+
+def instrument_callback(callback):
+    if getattr(callback, 'instrumented', False):
+        return callback
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        stats = UpdateStats()
+        token = current_stats.set(stats)
+        log_token = bind_update(update, name)
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            current_stats.reset(token)
+            handler_metrics[name].observe(duration, stats)
+            logger.debug('Handled update in %s', name,
+                         extra={'duration': round(duration, 6)})
+            if (slow_update_threshold is not None
+                    and duration >= slow_update_threshold):
+                logger.warning(
+                    'Slow update %s in %s: %.3fs total, %.3fs DB '
+                    '(%d queries), %.3fs API (%d calls)',
+                    getattr(update, 'update_id', None), name, duration,
+                    stats.db_time, stats.queries,
+                    stats.api_time, stats.api_calls,
+                )
+            log_context.reset(log_token)
+
+    wrapper.instrumented = True
+    return wrapper
+
+
+def instrument(handler: BaseHandler) -> BaseHandler:
+    if isinstance(handler, ConversationHandler):
+        for nested in handler.entry_points + handler.fallbacks:
+            instrument(nested)
+        for state_handlers in handler.states.values():
+            for nested in state_handlers:
+                instrument(nested)
+    else:
+        handler.callback = instrument_callback(handler.callback)
+    return handler
+
+
+def render_metrics() -> str:
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    items = sorted(handler_metrics.items())
+    family('bot_handler_calls_total', 'counter', 'Handler invocations.')
+    for name, metrics in items:
+        lines.append(f'bot_handler_calls_total{{handler="{name}"}} '
+                     f'{metrics.calls}')
+    family('bot_handler_errors_total', 'counter',
+           'Errors raised or logged by handlers.')
+    for name, metrics in items:
+        lines.append(f'bot_handler_errors_total{{handler="{name}"}} '
+                     f'{metrics.errors}')
+    family('bot_handler_duration_seconds', 'histogram',
+           'Handler wall time.')
+    for name, metrics in items:
+        for bound, count in zip(DURATION_BUCKETS, metrics.buckets):
+            lines.append(f'bot_handler_duration_seconds_bucket'
+                         f'{{handler="{name}",le="{bound}"}} {count}')
+        lines.append(f'bot_handler_duration_seconds_bucket'
+                     f'{{handler="{name}",le="+Inf"}} {metrics.calls}')
+        lines.append(f'bot_handler_duration_seconds_sum'
+                     f'{{handler="{name}"}} {metrics.duration:.6f}')
+        lines.append(f'bot_handler_duration_seconds_count'
+                     f'{{handler="{name}"}} {metrics.calls}')
+    family('bot_handler_db_seconds_total', 'counter',
+           'Time spent in database queries.')
+    for name, metrics in items:
+        lines.append(f'bot_handler_db_seconds_total{{handler="{name}"}} '
+                     f'{metrics.db_time:.6f}')
+    family('bot_handler_db_queries_total', 'counter',
+           'Database queries executed.')
+    for name, metrics in items:
+        lines.append(f'bot_handler_db_queries_total{{handler="{name}"}} '
+                     f'{metrics.queries}')
+    family('bot_handler_api_seconds_total', 'counter',
+           'Time spent in Bot API calls.')
+    for name, metrics in items:
+        lines.append(f'bot_handler_api_seconds_total{{handler="{name}"}} '
+                     f'{metrics.api_time:.6f}')
+    family('bot_handler_api_calls_total', 'counter', 'Bot API calls made.')
+    for name, metrics in items:
+        lines.append(f'bot_handler_api_calls_total{{handler="{name}"}} '
+                     f'{metrics.api_calls}')
+
+    cache_items = sorted(caches.items())
+    for stat, kind in (('hits', 'counter'), ('misses', 'counter'),
+                       ('size', 'gauge')):
+        metric = f'bot_cache_{stat}' + ('_total' if kind == 'counter' else '')
+        family(metric, kind, f'Cache {stat}.')
+        for name, cache in cache_items:
+            lines.append(f'{metric}{{cache="{name}"}} '
+                         f'{cache.stats()[stat]}')
+
+    for name, component in sorted(components.items()):
+        for key, value in component.stats().items():
+            metric = f'bot_{name}_{key}'
+            kind = 'counter' if key.endswith('_total') else 'gauge'
+            family(metric, kind, f'{name} {key.replace("_", " ")}.')
+            lines.append(f'{metric} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def start_metrics_server(host: str, port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info('Metrics available at http://%s:%s/metrics', host, port)
+    return server
+
+
+def setup(threshold: Optional[float] = None) -> None:
+    global slow_update_threshold
+    slow_update_threshold = threshold
+    handlers_logger = logging.getLogger('handlers')
+    if not any(isinstance(handler, ErrorCounter)
+               for handler in handlers_logger.handlers):
+        handlers_logger.addHandler(ErrorCounter())
@@ -0,0 +1,362 @@
+"""Brings the database schema up to date.
+
+Migrations not yet recorded in schema_migrations run in order, each in
+its own transaction. The first creates the tables as they were before
+migrations existed and the others check what is already there, so a
+new database goes through the same steps as one created by
+Base.metadata.create_all back then. Migrations describe the schema
+they create here, frozen, never through models.py, which only mirrors
+the result. Schema that models.py cannot describe, such as the point
+search index, exists only here. The bot runs this on start; to run it
+on its own (e.g. as a release step):
+
+    python migrations.py
+
+Add a migration by appending a function to MIGRATIONS, and update
+models.py to match; never reorder, remove or edit existing entries or
+the tables they create.
+"""
+import logging
+from collections import defaultdict
+
+from sqlalchemy import (
+    Column, Date, Float, ForeignKey, Index, Integer, LargeBinary, MetaData,
+    String, Table, UniqueConstraint, delete, exists, func, insert, inspect,
+    or_, select, text, update,
+)
+from sqlalchemy.orm import Session, aliased
+
+from logging_setup import configure_logging
+from models import (
+    NewShift, Notification, PersistedState, Point, Review, SchemaMigration,
+    Shift, ShiftReminder, User, engine,
+)
+from shift_stats import rebuild_stats
+
+logger = logging.getLogger(__name__)
+
+frozen = MetaData()
+
+# What create_all made before migrations existed, less the columns and
+# indexes migrations 2 to 4 add to older databases.
+BASELINE_TABLES = [
+    Table('users', frozen,
+          Column('id', Integer, primary_key=True),
+          Column('telegram_id', Integer, unique=True, nullable=False),
+          Column('role', String),
+          Column('rating', Float)),
+    Table('points', frozen,
+          Column('id', Integer, primary_key=True),
+          Column('name', String),
+          Column('address', String),
+          Column('owner_id', Integer, ForeignKey('users.id')),
+          Column('rating', Float)),
+    Table('shifts', frozen,
+          Column('id', Integer, primary_key=True),
+          Column('point_id', Integer, ForeignKey('points.id')),
+          Column('date', Date, nullable=False),
+          Column('worker_id', Integer, ForeignKey('users.id'))),
+    Table('reviews', frozen,
+          Column('id', Integer, primary_key=True),
+          Column('shift_id', Integer, ForeignKey('shifts.id'),
+                 nullable=False),
+          Column('author_id', Integer, ForeignKey('users.id'),
+                 nullable=False),
+          Column('point_id', Integer, ForeignKey('points.id')),
+          Column('user_id', Integer, ForeignKey('users.id')),
+          Column('score', Integer, nullable=False),
+          UniqueConstraint('shift_id', 'author_id')),
+    Table('subscriptions', frozen,
+          Column('id', Integer, primary_key=True),
+          Column('worker_id', Integer, ForeignKey('users.id'),
+                 nullable=False, index=True),
+          Column('point_id', Integer, ForeignKey('points.id'), index=True),
+          Column('area', String)),
+    Table('notifications', frozen,
+          Column('id', Integer, primary_key=True),
+          Column('worker_id', Integer, ForeignKey('users.id'),
+                 nullable=False),
+          Column('shift_id', Integer, ForeignKey('shifts.id'),
+                 nullable=False),
+          Index('ix_notifications_worker_id_id', 'worker_id', 'id')),
+    Table('shift_reminders', frozen,
+          Column('shift_id', Integer,
+                 ForeignKey('shifts.id', ondelete='CASCADE'),
+                 primary_key=True),
+          Column('date', Date, nullable=False)),
+    Table('persisted_state', frozen,
+          Column('kind', String, primary_key=True),
+          Column('key', String, primary_key=True),
+          Column('value', LargeBinary, nullable=False)),
+]
+
+shift_stats_table = Table(
+    'shift_stats', frozen,
+    Column('point_id', Integer, ForeignKey('points.id'), primary_key=True),
+    Column('month', Date, primary_key=True),
+    Column('total', Integer, nullable=False),
+    Column('filled', Integer, nullable=False),
+)
+
+shifts_archive_table = Table(
+    'shifts_archive', frozen,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('point_id', Integer),
+    Column('date', Date, nullable=False),
+    Column('worker_id', Integer),
+    Index('ix_shifts_archive_point_id_date', 'point_id', 'date'),
+)
+
+new_shifts_table = Table(
+    'new_shifts', frozen,
+    Column('shift_id', Integer, ForeignKey('shifts.id'), primary_key=True),
+)
+
+
+def add_column(connection, model, name, ddl):
+    table = model.__tablename__
+    columns = inspect(connection).get_columns(table)
+    if name in {column['name'] for column in columns}:
+        return False
+    connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+    return True
+
+
+def create_tables(connection):
+    frozen.create_all(connection, tables=BASELINE_TABLES)
+
+
+def widen_telegram_ids(connection):
+    # SQLite integers are 64-bit already.
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(
+            'ALTER TABLE users ALTER COLUMN telegram_id TYPE BIGINT'))
+
+
+def add_rating_sums(connection):
+    for model, target in ((User, Review.user_id), (Point, Review.point_id)):
+        added = [add_column(connection, model, name,
+                            'INTEGER NOT NULL DEFAULT 0')
+                 for name in ('rating_sum', 'rating_count')]
+        if not any(added):
+            continue
+        connection.execute(update(model).values(
+            rating_sum=select(func.coalesce(func.sum(Review.score), 0))
+            .where(target == model.id).scalar_subquery(),
+            rating_count=select(func.count(Review.id))
+            .where(target == model.id).scalar_subquery(),
+        ))
+
+
+def create_indexes(connection):
+    # The unique (point_id, date) one comes with make_shifts_unique.
+    for name, definition in (
+        ('ix_points_owner_id', 'points (owner_id)'),
+        ('ix_shifts_date_id', 'shifts (date, id)'),
+        ('ix_shifts_open_date_id',
+         'shifts (date, id) WHERE worker_id IS NULL'),
+        ('ix_shifts_open_point_id_date_id',
+         'shifts (point_id, date, id) WHERE worker_id IS NULL'),
+    ):
+        connection.execute(text(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {definition}'))
+    # Without statistics SQLite may skip the partial open-shift indexes.
+    connection.execute(text('ANALYZE'))
+
+
+def create_shift_stats(connection):
+    shift_stats_table.create(connection, checkfirst=True)
+    # Counted here rather than by rebuild_stats, which by now also reads
+    # tables later migrations create.
+    shifts, points = frozen.tables['shifts'], frozen.tables['points']
+    counts = defaultdict(lambda: [0, 0])
+    for point_id, date, worker_id in connection.execute(
+            select(shifts.c.point_id, shifts.c.date, shifts.c.worker_id)
+            .join(points, points.c.id == shifts.c.point_id)):
+        count = counts[point_id, date.replace(day=1)]
+        count[0] += 1
+        count[1] += worker_id is not None
+    connection.execute(delete(shift_stats_table))
+    if counts:
+        connection.execute(insert(shift_stats_table), [
+            {'point_id': point_id, 'month': month, 'total': total,
+             'filled': filled}
+            for (point_id, month), (total, filled) in counts.items()
+        ])
+
+
+def normalized(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def create_point_search(connection):
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_points_search ON points USING gin"
+            " ((coalesce(name, '') || ' ' || coalesce(address, ''))"
+            " gin_trgm_ops)"))
+        return
+    # FTS5 keeps its own copy of the text with ё folded to е, which the
+    # unicode61 tokenizer leaves alone; triggers follow point writes.
+    values = (f"new.id, {normalized('new.name')},"
+              f" {normalized('new.address')}")
+    for statement in (
+        'CREATE VIRTUAL TABLE IF NOT EXISTS points_fts USING fts5('
+        "name, address, tokenize='unicode61', prefix='1 2 3')",
+        'CREATE TRIGGER IF NOT EXISTS points_fts_insert AFTER INSERT ON'
+        ' points BEGIN INSERT INTO points_fts(rowid, name, address)'
+        f' VALUES ({values}); END',
+        'CREATE TRIGGER IF NOT EXISTS points_fts_update AFTER UPDATE OF'
+        ' name, address ON points BEGIN UPDATE points_fts SET'
+        f" name = {normalized('new.name')},"
+        f" address = {normalized('new.address')}"
+        ' WHERE rowid = old.id; END',
+        'CREATE TRIGGER IF NOT EXISTS points_fts_delete AFTER DELETE ON'
+        ' points BEGIN DELETE FROM points_fts WHERE rowid = old.id; END',
+        'DELETE FROM points_fts',
+        'INSERT INTO points_fts(rowid, name, address) SELECT'
+        f" id, {normalized('name')}, {normalized('address')} FROM points",
+    ):
+        connection.execute(text(statement))
+
+
+def create_shift_archive(connection):
+    shifts_archive_table.create(connection, checkfirst=True)
+    # Reviews outlive their shifts in the hot table.
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('ALTER TABLE reviews'
+                                ' DROP CONSTRAINT IF EXISTS'
+                                ' reviews_shift_id_fkey'))
+
+
+def make_shifts_unique(connection):
+    # Unclaimed copies of a point's day go; a claimed one is kept.
+    other = aliased(Shift)
+    shift_ids = list(connection.scalars(select(Shift.id).where(
+        Shift.worker_id.is_(None),
+        exists().where(
+            other.point_id == Shift.point_id,
+            other.date == Shift.date,
+            or_(other.worker_id.is_not(None), other.id < Shift.id),
+        ),
+    )))
+    for model in (Notification, ShiftReminder, Shift):
+        column = model.id if model is Shift else model.shift_id
+        connection.execute(delete(model).where(column.in_(shift_ids)))
+    conflicts = connection.execute(
+        select(Shift.point_id, Shift.date)
+        .group_by(Shift.point_id, Shift.date)
+        .having(func.count() > 1)
+        .limit(10)
+    ).all()
+    if conflicts:
+        raise RuntimeError(
+            'Several workers hold shifts of the same point and day, keep'
+            f' one of each and run again: {conflicts}')
+    if shift_ids:
+        logger.info('Removed %d duplicate shifts', len(shift_ids))
+        rebuild_stats(Session(bind=connection))
+    existing = {item['name']: item for item in
+                inspect(connection).get_indexes('shifts')}
+    index = existing.get('ix_shifts_point_id_date')
+    if index is None or not index['unique']:
+        if index is not None:
+            connection.execute(text('DROP INDEX ix_shifts_point_id_date'))
+        connection.execute(text('CREATE UNIQUE INDEX ix_shifts_point_id_date'
+                                ' ON shifts (point_id, date)'))
+
+
+def create_new_shifts(connection):
+    new_shifts_table.create(connection, checkfirst=True)
+    # Shifts past the notifier's old id cursor are still news.
+    cursor = connection.scalar(select(PersistedState.value).where(
+        PersistedState.kind == 'notifier',
+        PersistedState.key == 'last_shift_id',
+    ))
+    if cursor is None:
+        return
+    connection.execute(insert(NewShift).from_select(
+        ['shift_id'],
+        select(Shift.id).where(Shift.id > int(cursor)).where(
+            ~exists().where(NewShift.shift_id == Shift.id)),
+    ))
+    connection.execute(delete(PersistedState).where(
+        PersistedState.kind == 'notifier'))
+
+
+def stop_reusing_shift_ids(connection):
+    # PostgreSQL sequences never go back; SQLite reuses the highest id
+    # after a delete unless the table is declared AUTOINCREMENT.
+    if connection.dialect.name != 'sqlite':
+        return
+    table_sql = connection.scalar(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table'"
+        " AND name = 'shifts'"))
+    if 'AUTOINCREMENT' not in table_sql.upper():
+        index_sqls = list(connection.scalars(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'index'"
+            " AND tbl_name = 'shifts' AND sql IS NOT NULL")))
+        for statement in [
+            # Left behind if a rebuild stopped before its commit.
+            'DROP TABLE IF EXISTS shifts_rebuilt',
+            'CREATE TABLE shifts_rebuilt ('
+            'id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,'
+            ' point_id INTEGER, date DATE NOT NULL, worker_id INTEGER,'
+            ' FOREIGN KEY(point_id) REFERENCES points (id),'
+            ' FOREIGN KEY(worker_id) REFERENCES users (id))',
+            'INSERT INTO shifts_rebuilt (id, point_id, date, worker_id)'
+            ' SELECT id, point_id, date, worker_id FROM shifts',
+            'DROP TABLE shifts',
+            'ALTER TABLE shifts_rebuilt RENAME TO shifts',
+        ] + index_sqls:
+            connection.execute(text(statement))
+    # Archived ids count as used too.
+    connection.execute(text(
+        "DELETE FROM sqlite_sequence WHERE name = 'shifts'"))
+    connection.execute(text(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'shifts', max("
+        'coalesce((SELECT max(id) FROM shifts), 0),'
+        ' coalesce((SELECT max(id) FROM shifts_archive), 0))'))
+
+
+MIGRATIONS = [
+    create_tables,
+    widen_telegram_ids,
+    add_rating_sums,
+    create_indexes,
+    create_shift_stats,
+    create_point_search,
+    create_shift_archive,
+    make_shifts_unique,
+    create_new_shifts,
+    stop_reusing_shift_ids,
+]
+
+
+def migrate(bind=engine):
+    """Applies the missing migrations and returns their versions."""
+    with bind.begin() as connection:
+        SchemaMigration.__table__.create(connection, checkfirst=True)
+        applied = set(connection.scalars(select(SchemaMigration.version)))
+    versions = []
+    for version, migration in enumerate(MIGRATIONS, 1):
+        if version in applied:
+            continue
+        with bind.begin() as connection:
+            migration(connection)
+            connection.execute(insert(SchemaMigration).values(
+                version=version))
+        logger.info('Applied migration %d: %s', version, migration.__name__)
+        versions.append(version)
+    return versions
+
+
+def main():
+    configure_logging()
+    if not migrate():
+        logger.info('Schema is up to date')
+
+
+if __name__ == '__main__':
+    main()
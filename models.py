@@ -1,29 +1,65 @@
-import logging
+import asyncio
 from sqlalchemy import (
-    create_engine, Column, Integer, String, 
-    ForeignKey, Float, Date,
+    create_engine, event, Column, Integer, BigInteger, String,
+    ForeignKey, Float, Date, Index, LargeBinary, UniqueConstraint,
 )
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+
+from settings import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE, SQLITE_BUSY_TIMEOUT, SQLITE_MMAP_SIZE,
+)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}')
+    cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    cursor.close()
+
+
+def create_db_engine(url=DATABASE_URL):
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            return create_engine(url)
+        db_engine = create_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            connect_args={'timeout': SQLITE_BUSY_TIMEOUT / 1000},
+        )
+        event.listen(db_engine, 'connect', set_sqlite_pragmas)
+        return db_engine
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
 
 Base = declarative_base()
-engine = create_engine('sqlite:///bot.db')
+engine = create_db_engine()
 Session = sessionmaker(bind=engine)
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-logger = logging.getLogger(__name__)
-
 
 class User(Base):
     __tablename__ = 'users'
 
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True, nullable=False)
+    telegram_id = Column(BigInteger, unique=True, nullable=False)
     role = Column(String)
     rating = Column(Float, default=0.0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_count = Column(Integer, nullable=False, default=0)
     points = relationship('Point', back_populates='owner')
 
 
@@ -33,9 +69,11 @@ class Point(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String)
     address = Column(String)
-    owner_id = Column(Integer, ForeignKey('users.id'))
+    owner_id = Column(Integer, ForeignKey('users.id'), index=True)
     owner = relationship('User', back_populates='points')
     rating = Column(Float, default=0.0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_count = Column(Integer, nullable=False, default=0)
     shifts = relationship('Shift', back_populates='point')
 
 
@@ -48,7 +86,144 @@ class Shift(Base):
     worker_id = Column(Integer, ForeignKey('users.id'))
     point = relationship('Point', back_populates='shifts')
 
+    __table_args__ = (
+        Index('ix_shifts_date_id', 'date', 'id'),
+        # One shift per point and day; inserts skip existing pairs.
+        Index('ix_shifts_point_id_date', 'point_id', 'date', unique=True),
+        # Open shifts are a small, hot slice of the table: partial
+        # indexes keep their lookups independent of the history size.
+        Index('ix_shifts_open_date_id', 'date', 'id',
+              sqlite_where=worker_id.is_(None),
+              postgresql_where=worker_id.is_(None)),
+        Index('ix_shifts_open_point_id_date_id', 'point_id', 'date', 'id',
+              sqlite_where=worker_id.is_(None),
+              postgresql_where=worker_id.is_(None)),
+        # Ids outlive their rows in shifts_archive and reviews, so SQLite
+        # must never hand out a deleted one again.
+        {'sqlite_autoincrement': True},
+    )
+
+
+class ArchivedShift(Base):
+    """A past shift moved out of shifts by archiver.py.
+
+    Point and worker ids are kept as plain values: archived rows never
+    hold back deleting a point.
+    """
+    __tablename__ = 'shifts_archive'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    point_id = Column(Integer)
+    date = Column(Date, nullable=False)
+    worker_id = Column(Integer)
+
+    __table_args__ = (
+        Index('ix_shifts_archive_point_id_date', 'point_id', 'date'),
+    )
+
+
+class ShiftStats(Base):
+    """Shift counts per point and month, kept by shift_stats.py."""
+    __tablename__ = 'shift_stats'
+
+    point_id = Column(Integer, ForeignKey('points.id'), primary_key=True)
+    month = Column(Date, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    filled = Column(Integer, nullable=False, default=0)
+
+
+class Review(Base):
+    """A score left for a completed shift.
+
+    The worker of the shift reviews its point (point_id is set), the
+    owner of the point reviews the worker (user_id is set).
+    """
+    __tablename__ = 'reviews'
+
+    id = Column(Integer, primary_key=True)
+    # The shift may have moved to shifts_archive since.
+    shift_id = Column(Integer, nullable=False)
+    author_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    point_id = Column(Integer, ForeignKey('points.id'))
+    user_id = Column(Integer, ForeignKey('users.id'))
+    score = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('shift_id', 'author_id'),
+    )
+
+
+class Subscription(Base):
+    __tablename__ = 'subscriptions'
+
+    id = Column(Integer, primary_key=True)
+    worker_id = Column(Integer, ForeignKey('users.id'), nullable=False,
+                       index=True)
+    point_id = Column(Integer, ForeignKey('points.id'), index=True)
+    area = Column(String)
+
+
+class Notification(Base):
+    __tablename__ = 'notifications'
+
+    id = Column(Integer, primary_key=True)
+    worker_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    shift_id = Column(Integer, ForeignKey('shifts.id'), nullable=False)
+
+    __table_args__ = (
+        Index('ix_notifications_worker_id_id', 'worker_id', 'id'),
+    )
+
+
+class NewShift(Base):
+    """A shift subscribers have not been told about yet, see notifier.py.
+
+    Written in the transaction that inserts the shift, so neither
+    reused ids nor out-of-order commits make the notifier miss it.
+    """
+    __tablename__ = 'new_shifts'
+
+    shift_id = Column(Integer, ForeignKey('shifts.id'), primary_key=True)
+
+
+class ShiftReminder(Base):
+    """Marks that the reminder for a shift on this date was sent."""
+    __tablename__ = 'shift_reminders'
+
+    shift_id = Column(Integer, ForeignKey('shifts.id', ondelete='CASCADE'),
+                      primary_key=True)
+    date = Column(Date, nullable=False)
+
+
+class PersistedState(Base):
+    __tablename__ = 'persisted_state'
+
+    kind = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    value = Column(LargeBinary, nullable=False)
+
+
+class SchemaMigration(Base):
+    """One row per migration applied, see migrations.py."""
+    __tablename__ = 'schema_migrations'
+
+    version = Column(Integer, primary_key=True)
+
+
+def dialect_insert(session, model):
+    """Returns an INSERT for the session's dialect, with on_conflict_*."""
+    if session.get_bind().dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def call_in_session(func, *args):
+    session = Session()
+    try:
+        return func(session, *args)
+    finally:
+        session.close()
 
-Base.metadata.create_all(engine)
 
-session = Session()
+async def run_in_session(func, *args):
+    return await asyncio.to_thread(call_in_session, func, *args)
@@ -0,0 +1,237 @@
+import asyncio
+import datetime
+import logging
+import time
+from collections import defaultdict
+from typing import Optional
+
+from sqlalchemy import insert
+from telegram.error import BadRequest, Forbidden
+from telegram.ext import Application
+
+from handlers.shifts import claim_keyboard, render_open_shifts
+from models import (
+    NewShift, Notification, Point, Shift, Subscription, User,
+    run_in_session,
+)
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+SCAN_BATCH_SIZE = 5000
+DIGEST_MAX_SHIFTS = 20
+
+
+def match_subscribers(session, shifts):
+    point_ids = {row.point_id for row in shifts}
+    by_point = defaultdict(set)
+    for worker_id, point_id in session.query(
+            Subscription.worker_id, Subscription.point_id).filter(
+            Subscription.point_id.in_(point_ids)):
+        by_point[point_id].add(worker_id)
+    by_area = defaultdict(set)
+    for worker_id, area in session.query(
+            Subscription.worker_id, Subscription.area).filter(
+            Subscription.area.isnot(None)):
+        by_area[area].add(worker_id)
+
+    subscribers = {}
+    for point_id, address in {(row.point_id, row.address)
+                              for row in shifts}:
+        workers = set(by_point[point_id])
+        address = (address or '').lower()
+        for area, area_workers in by_area.items():
+            if area in address:
+                workers |= area_workers
+        subscribers[point_id] = workers
+    return subscribers
+
+
+def enqueue_notifications(session):
+    """Queues notifications for shifts listed in new_shifts.
+
+    Every open upcoming shift gets one row per subscribed worker, and
+    its new_shifts row goes in the same transaction, so after a restart
+    no shift is lost or queued twice. Returns the number of queued rows
+    and whether more new shifts are left.
+    """
+    shifts = (
+        session.query(Shift.id, Shift.point_id, Shift.date, Shift.worker_id,
+                      Point.address)
+        .join(NewShift, NewShift.shift_id == Shift.id)
+        .outerjoin(Point, Point.id == Shift.point_id)
+        .order_by(NewShift.shift_id)
+        .limit(SCAN_BATCH_SIZE)
+        .all()
+    )
+    if not shifts:
+        return 0, False
+    today = datetime.date.today()
+    open_shifts = [row for row in shifts
+                   if row.worker_id is None and row.date >= today]
+    rows = []
+    if open_shifts:
+        subscribers = match_subscribers(session, open_shifts)
+        rows = [
+            {'worker_id': worker_id, 'shift_id': row.id}
+            for row in open_shifts
+            for worker_id in subscribers[row.point_id]
+        ]
+    if rows:
+        session.execute(insert(Notification), rows)
+    session.query(NewShift).filter(
+        NewShift.shift_id.in_([row.id for row in shifts]),
+    ).delete(synchronize_session=False)
+    session.commit()
+    return len(rows), len(shifts) == SCAN_BATCH_SIZE
+
+
+def fetch_digests(session, limit):
+    """Returns up to limit pending digests, one per worker.
+
+    Each digest is [notification ids, telegram id, shifts]. Shifts that
+    were deleted or taken since they were queued are left out, but
+    their notification ids are kept so they get cleaned up.
+    """
+    worker_ids = [
+        worker_id for worker_id, in session.query(Notification.worker_id)
+        .distinct().order_by(Notification.worker_id).limit(limit)
+    ]
+    if not worker_ids:
+        return []
+    rows = (
+        session.query(Notification.id, Notification.worker_id,
+                      User.telegram_id, Shift.id, Shift.date,
+                      Shift.worker_id, Point.name, Point.address)
+        .outerjoin(User, User.id == Notification.worker_id)
+        .outerjoin(Shift, Shift.id == Notification.shift_id)
+        .outerjoin(Point, Point.id == Shift.point_id)
+        .filter(Notification.worker_id.in_(worker_ids))
+        .order_by(Notification.worker_id, Shift.date, Shift.id)
+    )
+    digests = {}
+    for (notification_id, worker_id, telegram_id, shift_id, date,
+         taken_by, name, address) in rows:
+        digest = digests.setdefault(worker_id, [[], telegram_id, []])
+        digest[0].append(notification_id)
+        if shift_id is not None and taken_by is None:
+            digest[2].append((shift_id, date, name, address))
+    return list(digests.values())
+
+
+def delete_notifications(session, notification_ids):
+    session.query(Notification).filter(
+        Notification.id.in_(notification_ids),
+    ).delete(synchronize_session=False)
+    session.commit()
+
+
+def render_digest(shifts):
+    text = render_open_shifts('Новые открытые смены:',
+                              shifts[:DIGEST_MAX_SHIFTS])
+    if len(shifts) > DIGEST_MAX_SHIFTS:
+        text += (f'\nИ еще {len(shifts) - DIGEST_MAX_SHIFTS}.'
+                 ' Полный список: /openshifts')
+    return text
+
+
+class Notifier:
+    """Sends workers digests of new open shifts they subscribed to.
+
+    A background task wakes up every interval seconds, matches shifts
+    listed in new_shifts against subscriptions into the
+    notifications table, and sends each worker with pending rows a
+    single message listing them. Sends run at most concurrency at a
+    time, paced to rate messages per second so the fan-out leaves room
+    for replies. Rows are deleted only after their message is sent, so
+    pending digests survive a restart.
+    """
+
+    def __init__(self, interval: float = 30, rate: float = 20,
+                 concurrency: int = 8, batch_size: int = 500) -> None:
+        self.interval = interval
+        self.batch_size = batch_size
+        self.bot = None
+        self._bucket = TokenBucket(rate, rate)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.last_round = 0.0
+
+    def stats(self) -> dict:
+        return {
+            'queued_total': self.queued,
+            'sent_total': self.sent,
+            'failed_total': self.failed,
+            'last_round_seconds': round(self.last_round, 6),
+        }
+
+    async def send_digest(self, telegram_id: int, shifts: list) -> bool:
+        """Returns False if the digest should be retried later."""
+        async with self._semaphore:
+            delay = self._bucket.reserve(time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.bot.send_message(
+                    telegram_id, render_digest(shifts),
+                    reply_markup=claim_keyboard(shifts[:DIGEST_MAX_SHIFTS]))
+            except (BadRequest, Forbidden) as error:
+                self.failed += 1
+                logger.warning('Dropping digest for %s: %s',
+                               telegram_id, error)
+                return True
+            except Exception:
+                self.failed += 1
+                logger.exception('Digest to %s not sent', telegram_id)
+                return False
+            self.sent += 1
+            return True
+
+    async def deliver(self, notification_ids, telegram_id, shifts) -> list:
+        if (telegram_id is None or not shifts
+                or await self.send_digest(telegram_id, shifts)):
+            return notification_ids
+        return []
+
+    async def run_once(self) -> bool:
+        """Runs one round and returns True if work is left over."""
+        start = time.perf_counter()
+        queued, more_shifts = await run_in_session(enqueue_notifications)
+        self.queued += queued
+        digests = await run_in_session(fetch_digests, self.batch_size)
+        delivered = await asyncio.gather(
+            *(self.deliver(*digest) for digest in digests))
+        done = [notification_id for notification_ids in delivered
+                for notification_id in notification_ids]
+        if done:
+            await run_in_session(delete_notifications, done)
+        self.last_round = time.perf_counter() - start
+        return more_shifts or (len(digests) == self.batch_size
+                               and all(delivered))
+
+    async def run(self) -> None:
+        while True:
+            try:
+                more = await self.run_once()
+            except Exception:
+                logger.exception('Notification pass failed')
+                more = False
+            if not more:
+                await asyncio.sleep(self.interval)
+
+    async def start(self, application: Application) -> None:
+        self.bot = application.bot
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self, application: Optional[Application] = None) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+import pickle
+from collections import defaultdict
+from typing import Dict, Optional
+
+from sqlalchemy import insert
+from telegram.ext import BasePersistence, PersistenceInput
+
+from models import PersistedState, run_in_session
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = 'user_data'
+CONVERSATION = 'conversation:'
+
+
+def load_states(session, kind):
+    return [
+        (key, pickle.loads(value))
+        for key, value in session.query(PersistedState.key,
+                                        PersistedState.value)
+        .filter(PersistedState.kind == kind)
+    ]
+
+
+def write_states(session, pending):
+    keys_by_kind = defaultdict(list)
+    for kind, key in pending:
+        keys_by_kind[kind].append(key)
+    for kind, keys in keys_by_kind.items():
+        session.query(PersistedState).filter(
+            PersistedState.kind == kind,
+            PersistedState.key.in_(keys),
+        ).delete(synchronize_session=False)
+    rows = [
+        {'kind': kind, 'key': key, 'value': value}
+        for (kind, key), value in pending.items()
+        if value is not None
+    ]
+    if rows:
+        session.execute(insert(PersistedState), rows)
+    session.commit()
+
+
+class SQLPersistence(BasePersistence):
+    """Keeps conversation states and user_data in the bot database.
+
+    Application hands over changed entries every update_interval
+    seconds. They are buffered and written together in one transaction
+    by a task scheduled after the batch, instead of one write per entry.
+    A batch that fails to write is retried with the next one.
+    Stored state is read only when the Application initializes.
+    """
+
+    def __init__(self, update_interval: float = 60) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False,
+                                        callback_data=False),
+            update_interval=update_interval,
+        )
+        self._pending = {}
+        self._write_task: Optional[asyncio.Task] = None
+
+    def _mark(self, kind: str, key: str, data) -> None:
+        self._pending[(kind, key)] = (
+            pickle.dumps(data) if data is not None else None)
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self) -> None:
+        while self._pending:
+            pending, self._pending = self._pending, {}
+            try:
+                await run_in_session(write_states, pending)
+            except Exception:
+                logger.exception('Writing conversation state failed')
+                # Kept for the next write; entries marked since are newer.
+                self._pending = {**pending, **self._pending}
+                return
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        return {
+            int(key): data
+            for key, data in await run_in_session(load_states, USER_DATA)
+        }
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {
+            tuple(json.loads(key)): state
+            for key, state in await run_in_session(load_states,
+                                                   CONVERSATION + name)
+        }
+
+    async def update_conversation(self, name: str, key: tuple,
+                                  new_state: Optional[object]) -> None:
+        self._mark(CONVERSATION + name, json.dumps(key), new_state)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._mark(USER_DATA, str(user_id), data)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._mark(USER_DATA, str(user_id), None)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        if self._write_task is not None:
+            await self._write_task
+        await self._write_pending()
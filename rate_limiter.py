@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+EDIT_ENDPOINTS = {'editMessageText', 'editMessageReplyMarkup'}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now: float) -> float:
+        """Takes one token and returns how long to wait until it is due."""
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class FloodControlRateLimiter(BaseRateLimiter):
+    """Paces outgoing Bot API calls to stay under Telegram flood limits.
+
+    Every request that targets a chat waits for a token from a global
+    bucket and from that chat's bucket, so requests leave in order and
+    never faster than the limits. While an edit of a message is waiting,
+    a newer edit of the same message replaces it and the older one is
+    dropped. RetryAfter pauses the affected chat and retries the request.
+    """
+
+    def __init__(self, overall_rate: float = 30, per_chat_rate: float = 1,
+                 per_chat_burst: float = 3, max_retries: int = 3,
+                 idle_chat_ttl: float = 60) -> None:
+        self.overall = TokenBucket(overall_rate, overall_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self.idle_chat_ttl = idle_chat_ttl
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        self._paused_until: Dict[Union[int, str], float] = {}
+        self._latest_edits = {}
+        self._last_cleanup = time.monotonic()
+        self.queue_depth = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.coalesced = 0
+        self.retries = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self.queue_depth,
+            'waits_total': self.waits,
+            'wait_seconds_total': round(self.wait_time, 6),
+            'wait_seconds_max': round(self.max_wait, 6),
+            'coalesced_edits_total': self.coalesced,
+            'retry_after_total': self.retries,
+        }
+
+    def _cleanup(self, now: float) -> None:
+        if now - self._last_cleanup < self.idle_chat_ttl:
+            return
+        self._last_cleanup = now
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items()
+                        if now - bucket.updated > self.idle_chat_ttl]:
+            del self._chats[chat_id]
+            self._paused_until.pop(chat_id, None)
+
+    def _delay(self, chat_id: Union[int, str]) -> float:
+        now = time.monotonic()
+        self._cleanup(now)
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.per_chat_rate,
+                                                        self.per_chat_burst)
+        delay = max(self.overall.reserve(now), bucket.reserve(now))
+        paused_until = self._paused_until.get(chat_id, 0.0)
+        return max(delay, paused_until - now)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any,
+                                          Union[bool, dict, List[dict]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Any],
+    ) -> Union[bool, dict, List[dict]]:
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+
+        edit_key = None
+        if endpoint in EDIT_ENDPOINTS and 'message_id' in data:
+            edit_key = (chat_id, data['message_id'])
+            marker = object()
+            self._latest_edits[edit_key] = marker
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                delay = self._delay(chat_id)
+                if delay > 0:
+                    self.queue_depth += 1
+                    try:
+                        await asyncio.sleep(delay)
+                    finally:
+                        self.queue_depth -= 1
+                    self.waits += 1
+                    self.wait_time += delay
+                    self.max_wait = max(self.max_wait, delay)
+                if (edit_key is not None
+                        and self._latest_edits.get(edit_key) is not marker):
+                    self.coalesced += 1
+                    return True
+                try:
+                    return await callback(*args, **kwargs)
+                except RetryAfter as error:
+                    if attempt == self.max_retries:
+                        raise
+                    self.retries += 1
+                    logger.warning('Flood control for chat %s, retrying'
+                                   ' in %ss', chat_id, error.retry_after)
+                    self._paused_until[chat_id] = (
+                        time.monotonic() + error.retry_after + 0.1)
+        finally:
+            if (edit_key is not None
+                    and self._latest_edits.get(edit_key) is marker):
+                del self._latest_edits[edit_key]
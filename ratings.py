@@ -0,0 +1,91 @@
+"""Recomputes user and point ratings from the reviews table.
+
+Ratings are kept incrementally as each review is written. This command
+streams all reviews once, rebuilds every sum, count and average, and
+reports the rows that had drifted. Run it after manual data fixes or
+as a periodic consistency check:
+
+    python ratings.py            # fix drifted ratings
+    python ratings.py --check    # only report them
+"""
+import argparse
+import logging
+from collections import defaultdict
+
+from sqlalchemy import update
+
+from logging_setup import configure_logging
+from migrations import migrate
+from models import Point, Review, User, call_in_session
+
+logger = logging.getLogger(__name__)
+
+REBUILD_CHUNK_SIZE = 10000
+
+
+def collect_ratings(session):
+    totals = {Point: defaultdict(lambda: [0, 0]),
+              User: defaultdict(lambda: [0, 0])}
+    for point_id, user_id, score in (
+            session.query(Review.point_id, Review.user_id, Review.score)
+            .yield_per(REBUILD_CHUNK_SIZE)):
+        if point_id is not None:
+            total = totals[Point][point_id]
+        else:
+            total = totals[User][user_id]
+        total[0] += score
+        total[1] += 1
+    return totals
+
+
+def find_drift(session, model, totals):
+    drift = []
+    for target_id, rating_sum, rating_count, rating in (
+            session.query(model.id, model.rating_sum, model.rating_count,
+                          model.rating)
+            .yield_per(REBUILD_CHUNK_SIZE)):
+        expected_sum, expected_count = totals.get(target_id, (0, 0))
+        expected = expected_sum / expected_count if expected_count else 0.0
+        if (rating_sum != expected_sum or rating_count != expected_count
+                or rating is None or abs(rating - expected) > 1e-9):
+            drift.append({'id': target_id, 'rating_sum': expected_sum,
+                          'rating_count': expected_count,
+                          'rating': expected})
+    return drift
+
+
+def rebuild_ratings(session, fix=True):
+    """Returns {model: rows that differed}, writing fixes if fix."""
+    totals = collect_ratings(session)
+    result = {}
+    for model in (Point, User):
+        drift = find_drift(session, model, totals[model])
+        if fix and drift:
+            for start in range(0, len(drift), REBUILD_CHUNK_SIZE):
+                session.execute(update(model),
+                                drift[start:start + REBUILD_CHUNK_SIZE])
+        result[model] = drift
+    session.commit()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--check', action='store_true',
+                        help='report drifted ratings without fixing them')
+    args = parser.parse_args()
+
+    configure_logging()
+    migrate()
+    result = call_in_session(rebuild_ratings, not args.check)
+    for model, drift in result.items():
+        logger.info('%s: %d ratings %s', model.__tablename__, len(drift),
+                    'drifted' if args.check else 'fixed')
+        for row in drift[:20]:
+            logger.info('  id=%s sum=%s count=%s rating=%.4f', row['id'],
+                        row['rating_sum'], row['rating_count'],
+                        row['rating'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+import asyncio
+import datetime
+import heapq
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import insert, or_
+from sqlalchemy.orm import aliased
+from telegram.error import BadRequest, Forbidden
+from telegram.ext import Application
+
+from cache import replicated
+from models import Point, Shift, ShiftReminder, User, run_in_session
+from rate_limiter import TokenBucket
+from settings import REMINDER_LEAD_HOURS, SHIFT_START_HOUR
+
+logger = logging.getLogger(__name__)
+
+
+def load_upcoming(session, date_from, date_to):
+    """Returns (id, date) of shifts in the range not yet reminded of."""
+    return [
+        tuple(row) for row in session.query(Shift.id, Shift.date)
+        .outerjoin(ShiftReminder, ShiftReminder.shift_id == Shift.id)
+        .filter(
+            Shift.date >= date_from,
+            Shift.date <= date_to,
+            or_(ShiftReminder.shift_id.is_(None),
+                ShiftReminder.date != Shift.date),
+        )
+    ]
+
+
+def claim_reminders(session, shift_ids):
+    """Marks the shifts as reminded and returns what to send.
+
+    The mark is committed before anything is sent, so a restart can
+    miss a reminder that was in flight but never sends one twice.
+    Shifts already reminded of for their current date are skipped.
+    """
+    owner = aliased(User)
+    worker = aliased(User)
+    rows = (
+        session.query(Shift.id, Shift.date, Point.name, Point.address,
+                      owner.telegram_id, worker.telegram_id,
+                      ShiftReminder.date)
+        .join(Point, Point.id == Shift.point_id)
+        .outerjoin(owner, owner.id == Point.owner_id)
+        .outerjoin(worker, worker.id == Shift.worker_id)
+        .outerjoin(ShiftReminder, ShiftReminder.shift_id == Shift.id)
+        .filter(Shift.id.in_(shift_ids))
+        .all()
+    )
+    fresh = [row[:6] for row in rows if row[6] != row[1]]
+    resent = [row[0] for row in rows if row[6] is not None
+              and row[6] != row[1]]
+    if resent:
+        session.query(ShiftReminder).filter(
+            ShiftReminder.shift_id.in_(resent),
+        ).delete(synchronize_session=False)
+    if fresh:
+        session.execute(insert(ShiftReminder), [
+            {'shift_id': shift_id, 'date': date}
+            for shift_id, date, *_ in fresh
+        ])
+    session.commit()
+    return fresh
+
+
+def render_reminders(rows):
+    for shift_id, date, name, address, owner_chat, worker_chat in rows:
+        where = f'{date:%d.%m.%Y} в пункте выдачи {name}, {address}'
+        if worker_chat:
+            yield worker_chat, f'Напоминание: смена {shift_id} {where}.'
+        if owner_chat:
+            status = ('соискатель назначен' if worker_chat
+                      else 'соискатель не назначен')
+            yield owner_chat, (f'Напоминание: смена {shift_id} {where},'
+                               f' {status}.')
+
+
+class ReminderQueue:
+    """Heap of reminders due inside the loaded window.
+
+    Entries are (remind_at, shift_id). Changes never search the heap:
+    _due holds the current time for every scheduled shift, and entries
+    that no longer match it are dropped when they reach the top.
+    Shifts beyond loaded_until are left to the next window load.
+    """
+
+    def __init__(self, lead_hours: float = 12,
+                 start_hour: int = 9) -> None:
+        self.lead = datetime.timedelta(hours=lead_hours)
+        self.start = datetime.time(start_hour)
+        self.loaded_until: Optional[datetime.datetime] = None
+        self.changed = asyncio.Event()
+        self._heap = []
+        self._due = {}
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def starts_at(self, date: datetime.date) -> datetime.datetime:
+        return datetime.datetime.combine(date, self.start)
+
+    def remind_at(self, date: datetime.date) -> datetime.datetime:
+        return self.starts_at(date) - self.lead
+
+    def _push(self, shift_id: int, date: datetime.date,
+              now: datetime.datetime) -> None:
+        remind_at = self.remind_at(date)
+        if (self.starts_at(date) <= now
+                or remind_at > self.loaded_until):
+            self._due.pop(shift_id, None)
+            return
+        if self._due.get(shift_id) != remind_at:
+            self._due[shift_id] = remind_at
+            heapq.heappush(self._heap, (remind_at, shift_id))
+
+    def load(self, rows, until: datetime.datetime) -> None:
+        now = datetime.datetime.now()
+        self.loaded_until = until
+        for shift_id, date in rows:
+            self._push(shift_id, date, now)
+        self.changed.set()
+
+    def update(self, shift_id: int, date: datetime.date) -> None:
+        if self.loaded_until is None:
+            return
+        self._push(shift_id, date, datetime.datetime.now())
+        self.changed.set()
+
+    def remove(self, shift_id: int) -> None:
+        self._due.pop(shift_id, None)
+
+    def _drop_stale(self) -> None:
+        while self._heap and (self._due.get(self._heap[0][1])
+                              != self._heap[0][0]):
+            heapq.heappop(self._heap)
+
+    def next_at(self) -> Optional[datetime.datetime]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime.datetime) -> list:
+        due = []
+        self._drop_stale()
+        while self._heap and self._heap[0][0] <= now:
+            _, shift_id = heapq.heappop(self._heap)
+            del self._due[shift_id]
+            due.append(shift_id)
+            self._drop_stale()
+        return due
+
+
+reminder_queue = ReminderQueue(REMINDER_LEAD_HOURS, SHIFT_START_HOUR)
+
+
+@replicated
+def schedule_reminder(shift_id, date):
+    reminder_queue.update(shift_id, date)
+
+
+@replicated
+def cancel_reminder(shift_id):
+    reminder_queue.remove(shift_id)
+
+
+class ReminderScheduler:
+    """Sends workers and owners a reminder before each shift.
+
+    Only shifts whose reminder falls in the next window hours are
+    loaded, with an indexed date range query repeated every
+    refresh_interval seconds, into reminder_queue. Shift handlers keep
+    the queue current between loads. The task sleeps until the next
+    reminder is due or the queue changes, and sends through a paced,
+    bounded fan-out like the notifier.
+    """
+
+    def __init__(self, queue: ReminderQueue = reminder_queue,
+                 window_hours: float = 24, refresh_interval: float = 600,
+                 rate: float = 20, concurrency: int = 8) -> None:
+        self.queue = queue
+        self.window = datetime.timedelta(hours=window_hours)
+        self.refresh_interval = refresh_interval
+        self.bot = None
+        self._bucket = TokenBucket(rate, rate)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self._next_refresh = 0.0
+        self.sent = 0
+        self.failed = 0
+
+    def stats(self) -> dict:
+        return {
+            'scheduled': len(self.queue),
+            'sent_total': self.sent,
+            'failed_total': self.failed,
+        }
+
+    async def refresh(self) -> None:
+        now = datetime.datetime.now()
+        until = now + self.window
+        rows = await run_in_session(load_upcoming, now.date(),
+                                    (until + self.queue.lead).date())
+        self.queue.load(rows, until)
+        self._next_refresh = time.monotonic() + self.refresh_interval
+
+    async def send_reminder(self, chat_id: int, text: str) -> None:
+        async with self._semaphore:
+            delay = self._bucket.reserve(time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.bot.send_message(chat_id, text)
+                self.sent += 1
+            except (BadRequest, Forbidden) as error:
+                self.failed += 1
+                logger.warning('Reminder to %s not sent: %s', chat_id, error)
+            except Exception:
+                self.failed += 1
+                logger.exception('Reminder to %s not sent', chat_id)
+
+    async def send_due(self) -> None:
+        due = self.queue.pop_due(datetime.datetime.now())
+        if not due:
+            return
+        rows = await run_in_session(claim_reminders, due)
+        await asyncio.gather(*(self.send_reminder(chat_id, text)
+                               for chat_id, text in render_reminders(rows)))
+
+    def sleep_time(self) -> float:
+        delay = self._next_refresh - time.monotonic()
+        next_at = self.queue.next_at()
+        if next_at is not None:
+            delay = min(delay, (next_at
+                                - datetime.datetime.now()).total_seconds())
+        return max(delay, 0.0)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                if time.monotonic() >= self._next_refresh:
+                    await self.refresh()
+                await self.send_due()
+            except Exception:
+                logger.exception('Reminder pass failed')
+                self._next_refresh = time.monotonic() + self.refresh_interval
+            self.queue.changed.clear()
+            try:
+                await asyncio.wait_for(self.queue.changed.wait(),
+                                       self.sleep_time())
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self, application: Application) -> None:
+        self.bot = application.bot
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self, application: Optional[Application] = None) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.queue.loaded_until = None
@@ -0,0 +1,53 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///bot.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 2 ** 20)))
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_JSON = os.getenv('LOG_JSON', '0') == '1'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_ERROR_SAMPLE_INTERVAL = float(
+    os.getenv('LOG_ERROR_SAMPLE_INTERVAL', '60'))
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1'))
+
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '32'))
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '1'))
+PERSISTENCE_INTERVAL = float(os.getenv('PERSISTENCE_INTERVAL', '30'))
+
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = float(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+
+NOTIFY_INTERVAL = float(os.getenv('NOTIFY_INTERVAL', '30'))
+NOTIFY_RATE = float(os.getenv('NOTIFY_RATE', '20'))
+NOTIFY_CONCURRENCY = int(os.getenv('NOTIFY_CONCURRENCY', '8'))
+NOTIFY_BATCH_SIZE = int(os.getenv('NOTIFY_BATCH_SIZE', '500'))
+
+SHIFT_START_HOUR = int(os.getenv('SHIFT_START_HOUR', '9'))
+REMINDER_LEAD_HOURS = float(os.getenv('REMINDER_LEAD_HOURS', '12'))
+REMINDER_WINDOW_HOURS = float(os.getenv('REMINDER_WINDOW_HOURS', '24'))
+REMINDER_REFRESH_INTERVAL = float(
+    os.getenv('REMINDER_REFRESH_INTERVAL', '600'))
+
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '180'))
+ARCHIVE_INTERVAL = float(os.getenv('ARCHIVE_INTERVAL', '3600'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '1000'))
+
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+SLOW_UPDATE_THRESHOLD = (float(os.getenv('SLOW_UPDATE_THRESHOLD'))
+                         if os.getenv('SLOW_UPDATE_THRESHOLD') else None)
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+import threading
+from typing import Awaitable, Callable, List
+
+from telegram import Bot, Update
+from telegram.ext import Application, Updater
+
+import cache
+from logging_setup import configure_logging
+from metrics import start_metrics_server
+from settings import METRICS_HOST, METRICS_PORT
+from update_processor import ChatOrderedUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+STOP = None
+
+
+def shard_of(update: Update, shards: int) -> int:
+    return (ChatOrderedUpdateProcessor.chat_key(update) or 0) % shards
+
+
+async def serve_worker(factory: Callable[[], Application], index: int,
+                       inbox, events) -> None:
+    application = factory()
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+
+    def deliver(data: dict) -> None:
+        application.update_queue.put_nowait(
+            Update.de_json(data, application.bot))
+
+    def read_inbox() -> None:
+        while True:
+            message = inbox.get()
+            if message is STOP:
+                loop.call_soon_threadsafe(stopped.set)
+                return
+            kind, *payload = message
+            if kind == 'update':
+                loop.call_soon_threadsafe(deliver, *payload)
+            elif kind == 'replicate':
+                loop.call_soon_threadsafe(cache.apply_replicated, *payload)
+
+    cache.set_replicator(
+        lambda name, args: events.put(('replicate', index, name, args)))
+    if METRICS_PORT:
+        start_metrics_server(METRICS_HOST, METRICS_PORT + index)
+    async with application:
+        # Background jobs (notifications, reminders) run in one worker.
+        if index == 0 and application.post_init:
+            await application.post_init(application)
+        await application.start()
+        threading.Thread(target=read_inbox, daemon=True).start()
+        events.put(('ready', index))
+        await stopped.wait()
+        await application.stop()
+        if index == 0 and application.post_stop:
+            await application.post_stop(application)
+
+
+def run_worker(factory: Callable[[], Application], index: int,
+               inbox, events) -> None:
+    # The receiver handles the signals and stops the workers in order.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    configure_logging()
+    asyncio.run(serve_worker(factory, index, inbox, events))
+
+
+class WorkerPool:
+    """Runs handlers in several processes and routes updates by chat.
+
+    Every update goes to the worker chosen by its chat (or user) id, so
+    a chat's updates, its ConversationHandler state and user_data stay
+    in one process, in order. All workers share the database. Cache
+    invalidations marked with cache.replicated are relayed from the
+    worker that made them to all the others.
+    """
+
+    def __init__(self, factory: Callable[[], Application],
+                 processes: int) -> None:
+        context = multiprocessing.get_context('spawn')
+        self.inboxes = [context.Queue() for _ in range(processes)]
+        self.events = context.Queue()
+        self.processes = [
+            context.Process(target=run_worker,
+                            args=(factory, index, inbox, self.events),
+                            name=f'bot-worker-{index}')
+            for index, inbox in enumerate(self.inboxes)
+        ]
+        self.dispatched: List[int] = [0] * processes
+        self.ready = threading.Event()
+        self._relay = threading.Thread(target=self._relay_events,
+                                       daemon=True)
+
+    def _relay_events(self) -> None:
+        ready = 0
+        while True:
+            event = self.events.get()
+            if event is STOP:
+                return
+            kind, index, *payload = event
+            if kind == 'ready':
+                ready += 1
+                if ready == len(self.processes):
+                    self.ready.set()
+                continue
+            for other, inbox in enumerate(self.inboxes):
+                if other != index:
+                    inbox.put(('replicate', *payload))
+
+    def start(self) -> None:
+        for process in self.processes:
+            process.start()
+        self._relay.start()
+
+    def wait_ready(self) -> None:
+        while not self.ready.wait(1):
+            if not all(process.is_alive() for process in self.processes):
+                raise RuntimeError('a worker process exited on startup')
+
+    def dispatch(self, update: Update) -> None:
+        shard = shard_of(update, len(self.inboxes))
+        self.dispatched[shard] += 1
+        self.inboxes[shard].put(('update', update.to_dict()))
+
+    def close(self) -> None:
+        """Lets the workers finish their queued updates and exit."""
+        for inbox in self.inboxes:
+            inbox.put(STOP)
+        for process in self.processes:
+            process.join()
+        self.events.put(STOP)
+        self._relay.join()
+
+
+async def receive(pool: WorkerPool, token: str,
+                  start_updater: Callable[[Updater], Awaitable]) -> None:
+    updater = Updater(Bot(token), asyncio.Queue())
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    async def forward() -> None:
+        while True:
+            pool.dispatch(await updater.update_queue.get())
+
+    async with updater:
+        await start_updater(updater)
+        forwarder = asyncio.create_task(forward())
+        await stop.wait()
+        await updater.stop()
+        while not updater.update_queue.empty():
+            pool.dispatch(updater.update_queue.get_nowait())
+        forwarder.cancel()
+
+
+def run_sharded(factory: Callable[[], Application], processes: int,
+                token: str,
+                start_updater: Callable[[Updater], Awaitable]) -> None:
+    """Receives updates here and handles them in worker processes."""
+    pool = WorkerPool(factory, processes)
+    pool.start()
+    try:
+        pool.wait_ready()
+        logger.info('%d worker processes ready', processes)
+        asyncio.run(receive(pool, token, start_updater))
+    finally:
+        pool.close()
@@ -0,0 +1,135 @@
+"""Keeps and rebuilds the per-point monthly shift counts.
+
+shift_stats holds (point_id, month, total, filled). Every write to
+shifts adjusts it in the same transaction through count_shifts, so
+/stats reads a few rows per point however long the shift history is.
+This command recounts everything from shifts and shifts_archive and
+fixes the rows that had drifted. Run it after manual data fixes or backfills:
+
+    python shift_stats.py            # fix drifted counts
+    python shift_stats.py --check    # only report them
+"""
+import argparse
+import logging
+from collections import defaultdict
+
+from logging_setup import configure_logging
+from models import (
+    ArchivedShift, Point, Shift, ShiftStats, call_in_session,
+    dialect_insert,
+)
+
+logger = logging.getLogger(__name__)
+
+REBUILD_CHUNK_SIZE = 10000
+
+
+def month_of(date):
+    return date.replace(day=1)
+
+
+def upsert_stats(session, rows, increment):
+    """Writes monthly counts with one INSERT .. ON CONFLICT statement.
+
+    Counts of months already stored are added to if increment and
+    replaced otherwise.
+    """
+    statement = dialect_insert(session, ShiftStats)
+    new = statement.excluded
+    if increment:
+        values = {'total': ShiftStats.total + new.total,
+                  'filled': ShiftStats.filled + new.filled}
+    else:
+        values = {'total': new.total, 'filled': new.filled}
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[ShiftStats.point_id, ShiftStats.month],
+        set_=values,
+    ), rows)
+
+
+def count_shifts(session, changes):
+    """Adds (point_id, date, total, filled) deltas to the monthly counts.
+
+    The caller commits, so the counts change together with the shifts.
+    Concurrent writers add to a row in one statement each and never
+    overwrite each other.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for point_id, date, total, filled in changes:
+        if point_id is not None:
+            delta = deltas[point_id, month_of(date)]
+            delta[0] += total
+            delta[1] += filled
+    rows = [
+        {'point_id': point_id, 'month': month, 'total': total,
+         'filled': filled}
+        for (point_id, month), (total, filled) in deltas.items()
+        if total or filled
+    ]
+    if rows:
+        upsert_stats(session, rows, increment=True)
+
+
+def collect_stats(session):
+    counts = defaultdict(lambda: [0, 0])
+    for model in (Shift, ArchivedShift):
+        for point_id, date, worker_id in (
+                session.query(model.point_id, model.date, model.worker_id)
+                .join(Point, Point.id == model.point_id)
+                .yield_per(REBUILD_CHUNK_SIZE)):
+            count = counts[point_id, month_of(date)]
+            count[0] += 1
+            count[1] += worker_id is not None
+    return counts
+
+
+def find_drift(session, counts):
+    drift = []
+    stored = set()
+    for point_id, month, total, filled in (
+            session.query(ShiftStats.point_id, ShiftStats.month,
+                          ShiftStats.total, ShiftStats.filled)
+            .yield_per(REBUILD_CHUNK_SIZE)):
+        stored.add((point_id, month))
+        expected_total, expected_filled = counts.get((point_id, month),
+                                                     (0, 0))
+        if total != expected_total or filled != expected_filled:
+            drift.append({'point_id': point_id, 'month': month,
+                          'total': expected_total,
+                          'filled': expected_filled})
+    for (point_id, month), (total, filled) in counts.items():
+        if (point_id, month) not in stored:
+            drift.append({'point_id': point_id, 'month': month,
+                          'total': total, 'filled': filled})
+    return drift
+
+
+def rebuild_stats(session, fix=True):
+    """Returns the rows that differed, writing fixes if fix."""
+    drift = find_drift(session, collect_stats(session))
+    if fix:
+        for start in range(0, len(drift), REBUILD_CHUNK_SIZE):
+            upsert_stats(session, drift[start:start + REBUILD_CHUNK_SIZE],
+                         increment=False)
+    session.commit()
+    return drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--check', action='store_true',
+                        help='report drifted counts without fixing them')
+    args = parser.parse_args()
+
+    configure_logging()
+    drift = call_in_session(rebuild_stats, not args.check)
+    logger.info('%d monthly counts %s', len(drift),
+                'drifted' if args.check else 'fixed')
+    for row in drift[:20]:
+        logger.info('  point_id=%s month=%s total=%s filled=%s',
+                    row['point_id'], row['month'], row['total'],
+                    row['filled'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import asyncio
+from typing import Any, Awaitable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# PTB's own limit, taken before do_process_update; see below.
+UNBOUNDED = 2 ** 31 - 1
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently, but one at a time per chat.
+
+    Updates from different chats run in parallel up to limit, while
+    updates from the same chat wait on a per-chat lock so
+    ConversationHandler flows see them in order. PTB holds its
+    max_concurrent_updates slot while do_process_update waits, so that
+    limit is left unbounded and the real one is taken after the chat
+    lock; otherwise a busy chat's backlog would fill every slot and
+    stall the other chats.
+    """
+
+    def __init__(self, limit: int) -> None:
+        if limit < 1:
+            raise ValueError('limit must be a positive integer')
+        super().__init__(UNBOUNDED)
+        self.limit = limit
+        self._running = asyncio.BoundedSemaphore(limit)
+        self._chat_locks = {}
+
+    @staticmethod
+    def chat_key(update: object) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object,
+                                coroutine: Awaitable[Any]) -> None:
+        key = self.chat_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        entry = self._chat_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self._running:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass